@@ -3,7 +3,7 @@
 # Copyright (C) 2016-2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, logging
+import os, logging, time, importlib
 import cffi
 
 
@@ -20,6 +20,7 @@ SOURCE_FILES = [
     'kin_winch.c', 'kin_extruder.c',
 ]
 DEST_LIB = "c_helper.so"
+DEST_FFI = "c_helper_ffi"
 OTHER_FILES = [
     'list.h', 'serialqueue.h', 'stepcompress.h', 'itersolve.h', 'pyhelper.h'
 ]
@@ -104,6 +105,9 @@ defs_serialqueue = """
     void serialqueue_free_commandqueue(struct command_queue *cq);
     void serialqueue_send(struct serialqueue *sq, struct command_queue *cq
         , uint8_t *msg, int len, uint64_t min_clock, uint64_t req_clock);
+    void serialqueue_send_multiple(struct serialqueue *sq
+        , struct command_queue *cq, uint8_t *msgs, int *lens, int count
+        , uint64_t min_clock, uint64_t req_clock);
     void serialqueue_pull(struct serialqueue *sq
         , struct pull_queue_message *pqm);
     void serialqueue_set_baud_adjust(struct serialqueue *sq
@@ -155,6 +159,28 @@ def check_build_code(srcdir, target, sources, cmd, other_files=[]):
         destlib = os.path.join(srcdir, target)
         os.system(cmd % (destlib, ' '.join(srcfiles)))
 
+# Load the cffi definitions.  Parsing the definitions is slow, so a
+# pre-parsed copy is stored in a generated python module (which is
+# regenerated whenever this file changes).
+def load_ffi_defs(srcdir):
+    ffi_times = get_mtimes(srcdir, [DEST_FFI + ".py"])
+    src_times = get_mtimes(srcdir, ["__init__.py"])
+    try:
+        if not ffi_times or max(src_times) > min(ffi_times):
+            logging.info("Generating cffi definitions module %s", DEST_FFI)
+            ffibuilder = cffi.FFI()
+            for d in defs_all:
+                ffibuilder.cdef(d)
+            ffibuilder.set_source(DEST_FFI, None)
+            ffibuilder.emit_python_code(os.path.join(srcdir, DEST_FFI + ".py"))
+        return importlib.import_module(__name__ + "." + DEST_FFI).ffi
+    except Exception as e:
+        logging.info("Unable to use cached cffi definitions: %s", str(e))
+    ffi_main = cffi.FFI()
+    for d in defs_all:
+        ffi_main.cdef(d)
+    return ffi_main
+
 FFI_main = None
 FFI_lib = None
 pyhelper_logging_callback = None
@@ -163,19 +189,20 @@ pyhelper_logging_callback = None
 def get_ffi():
     global FFI_main, FFI_lib, pyhelper_logging_callback
     if FFI_lib is None:
+        start_time = time.time()
         srcdir = os.path.dirname(os.path.realpath(__file__))
         check_build_code(srcdir, DEST_LIB, SOURCE_FILES, COMPILE_CMD
                          , OTHER_FILES)
-        FFI_main = cffi.FFI()
-        for d in defs_all:
-            FFI_main.cdef(d)
+        FFI_main = load_ffi_defs(srcdir)
         FFI_lib = FFI_main.dlopen(os.path.join(srcdir, DEST_LIB))
         # Setup error logging
         def logging_callback(msg):
             logging.error(FFI_main.string(msg))
         pyhelper_logging_callback = FFI_main.callback(
-            "void(const char *)", logging_callback)
+            "void(*)(const char *)", logging_callback)
         FFI_lib.set_python_logging_callback(pyhelper_logging_callback)
+        logging.info("Loaded C helper library in %.3fs",
+                     time.time() - start_time)
     return FFI_main, FFI_lib
 
 
@@ -972,6 +972,26 @@ serialqueue_send(struct serialqueue *sq, struct command_queue *cq, uint8_t *msg
     serialqueue_send_batch(sq, cq, &msgs);
 }
 
+// Schedule the transmission of a series of messages (the messages are
+// stored back-to-back in 'msgs' with their lengths in 'lens')
+void __visible
+serialqueue_send_multiple(struct serialqueue *sq, struct command_queue *cq
+                          , uint8_t *msgs, int *lens, int count
+                          , uint64_t min_clock, uint64_t req_clock)
+{
+    struct list_head list;
+    list_init(&list);
+    int i;
+    for (i=0; i<count; i++) {
+        struct queue_message *qm = message_fill(msgs, lens[i]);
+        qm->min_clock = min_clock;
+        qm->req_clock = req_clock;
+        list_add_tail(&qm->node, &list);
+        msgs += lens[i];
+    }
+    serialqueue_send_batch(sq, cq, &list);
+}
+
 // Like serialqueue_send() but also builds the message to be sent
 void
 serialqueue_encode_and_send(struct serialqueue *sq, struct command_queue *cq
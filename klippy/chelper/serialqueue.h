@@ -55,6 +55,9 @@ void serialqueue_send_batch(struct serialqueue *sq, struct command_queue *cq
 void serialqueue_send(struct serialqueue *sq, struct command_queue *cq
                       , uint8_t *msg, int len
                       , uint64_t min_clock, uint64_t req_clock);
+void serialqueue_send_multiple(struct serialqueue *sq, struct command_queue *cq
+                               , uint8_t *msgs, int *lens, int count
+                               , uint64_t min_clock, uint64_t req_clock);
 void serialqueue_encode_and_send(
     struct serialqueue *sq, struct command_queue *cq
     , uint32_t *data, int len, uint64_t min_clock, uint64_t req_clock);
@@ -8,6 +8,20 @@ import logging, math
 RTT_AGE = .000010 / (60. * 60.)
 DECAY = 1. / 30.
 TRANSMIT_EXTRA = .001
+QUERY_TIME = .9839
+# After a connect or prediction reset, query the clock more often (up
+# to FAST_QUERIES times) until the prediction stddev (in seconds) drops
+# below CONVERGED_STDDEV
+FAST_QUERY_TIME = .1839
+FAST_QUERIES = 200
+CONVERGED_STDDEV = .000050
+
+# Clock regression state of disconnected mcus (indexed by serial port)
+saved_state = {}
+SAVED_STATE_FIELDS = [
+    'clock_est', 'min_half_rtt', 'min_rtt_time', 'time_avg', 'time_variance',
+    'clock_avg', 'clock_covariance', 'prediction_variance',
+    'last_prediction_time']
 
 class ClockSync:
     def __init__(self, reactor):
@@ -16,6 +30,8 @@ class ClockSync:
         self.get_clock_timer = reactor.register_timer(self._get_clock_event)
         self.get_clock_cmd = None
         self.queries_pending = 0
+        self.pending_time = 0.
+        self.fast_queries = FAST_QUERIES
         self.mcu_freq = 1.
         self.last_clock = 0
         self.clock_est = (0., 0., 0.)
@@ -27,6 +43,10 @@ class ClockSync:
         self.clock_avg = self.clock_covariance = 0.
         self.prediction_variance = 0.
         self.last_prediction_time = 0.
+        # Statistics
+        self.last_rtt = 0.
+        self.outlier_count = self.reset_count = self.fast_count = 0
+        self.last_stats_freq = 0.
     def connect(self, serial):
         self.serial = serial
         self.mcu_freq = serial.msgparser.get_constant_float('CLOCK_FREQ')
@@ -40,12 +60,42 @@ class ClockSync:
         self.prediction_variance = (.001 * self.mcu_freq)**2
         # Enable periodic get_clock timer
         self.get_clock_cmd = serial.lookup_command('get_clock')
-        for i in range(8):
+        if self._restore_state(params['#sent_time']):
             params = self.get_clock_cmd.send_with_response(response='clock')
             self._handle_clock(params)
-            self.reactor.pause(0.100)
+        else:
+            for i in range(8):
+                params = self.get_clock_cmd.send_with_response(
+                    response='clock')
+                self._handle_clock(params)
+                self.reactor.pause(0.100)
         serial.register_callback(self._handle_clock, 'clock')
         self.reactor.update_timer(self.get_clock_timer, self.reactor.NOW)
+    def _restore_state(self, sent_time):
+        # Reuse the regression from a previous host connection if the
+        # mcu clock has continued to run since then
+        state = saved_state.pop(self.serial.serialport, None)
+        if state is None or state['mcu_freq'] != self.mcu_freq:
+            return False
+        exp_clock = ((sent_time - state['time_avg']) * state['clock_est'][2]
+                     + state['clock_avg'])
+        if abs(self.last_clock - exp_clock) > .000500 * self.mcu_freq:
+            logging.info("Discarding saved clock state (diff=%d)",
+                         self.last_clock - exp_clock)
+            return False
+        for name in SAVED_STATE_FIELDS:
+            setattr(self, name, state[name])
+        logging.info("Restored clock state (diff=%d)",
+                     self.last_clock - exp_clock)
+        return True
+    def disconnect(self):
+        self.reactor.update_timer(self.get_clock_timer, self.reactor.NEVER)
+        if self.get_clock_cmd is None or not self.is_active():
+            return
+        state = {name: getattr(self, name) for name in SAVED_STATE_FIELDS}
+        state['mcu_freq'] = self.mcu_freq
+        saved_state[self.serial.serialport] = state
+        self.get_clock_cmd = None
     def connect_file(self, serial, pace=False):
         self.serial = serial
         self.mcu_freq = serial.msgparser.get_constant_float('CLOCK_FREQ')
@@ -57,10 +107,21 @@ class ClockSync:
     # MCU clock querying (_handle_clock is invoked from background thread)
     def _get_clock_event(self, eventtime):
         self.get_clock_cmd.send()
+        if not self.queries_pending:
+            self.pending_time = eventtime
         self.queries_pending += 1
         # Use an unusual time for the next event so clock messages
         # don't resonate with other periodic events.
-        return eventtime + .9839
+        if self.fast_queries:
+            # Sample faster until the regression has settled
+            pred_stddev = math.sqrt(self.prediction_variance) / self.mcu_freq
+            if pred_stddev < CONVERGED_STDDEV:
+                self.fast_queries = 0
+            else:
+                self.fast_queries -= 1
+                self.fast_count += 1
+                return eventtime + FAST_QUERY_TIME
+        return eventtime + QUERY_TIME
     def _handle_clock(self, params):
         self.queries_pending = 0
         # Extend clock to 64bit
@@ -74,6 +135,7 @@ class ClockSync:
         if not sent_time:
             return
         receive_time = params['#receive_time']
+        self.last_rtt = receive_time - sent_time
         half_rtt = .5 * (receive_time - sent_time)
         aged_rtt = (sent_time - self.min_rtt_time) * RTT_AGE
         if half_rtt < self.min_half_rtt + aged_rtt:
@@ -92,12 +154,15 @@ class ClockSync:
                               " freq=%d diff=%d stddev=%.3f",
                               sent_time, self.clock_est[2], clock - exp_clock,
                               math.sqrt(self.prediction_variance))
+                self.outlier_count += 1
                 return
             logging.info("Resetting prediction variance %.3f:"
                          " freq=%d diff=%d stddev=%.3f",
                          sent_time, self.clock_est[2], clock - exp_clock,
                          math.sqrt(self.prediction_variance))
             self.prediction_variance = (.001 * self.mcu_freq)**2
+            self.reset_count += 1
+            self.fast_queries = FAST_QUERIES
         else:
             self.last_prediction_time = sent_time
             self.prediction_variance = (
@@ -141,7 +206,8 @@ class ClockSync:
             return last_clock + 0x100000000 - clock_diff
         return last_clock - clock_diff
     def is_active(self):
-        return self.queries_pending <= 4
+        return (self.queries_pending <= 4 or self.reactor.monotonic()
+                < self.pending_time + 4. * QUERY_TIME)
     def dump_debug(self):
         sample_time, clock, freq = self.clock_est
         return ("clocksync state: mcu_freq=%d last_clock=%d"
@@ -155,7 +221,16 @@ class ClockSync:
                     self.prediction_variance))
     def stats(self, eventtime):
         sample_time, clock, freq = self.clock_est
-        return "freq=%d" % (freq,)
+        # Change of the estimated frequency since the last report (in ppm)
+        drift = 0.
+        if self.last_stats_freq:
+            drift = (freq - self.last_stats_freq) * 1000000. / self.mcu_freq
+        self.last_stats_freq = freq
+        pred_stddev = math.sqrt(self.prediction_variance) / self.mcu_freq
+        return ("freq=%d rtt=%.6f stddev=%.6f drift=%.3f outliers=%d"
+                " resets=%d fast_queries=%d" % (
+                    freq, self.last_rtt, pred_stddev, drift,
+                    self.outlier_count, self.reset_count, self.fast_count))
     def calibrate_clock(self, print_time, eventtime):
         return (0., self.mcu_freq)
 
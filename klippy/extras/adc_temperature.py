@@ -18,7 +18,18 @@ RANGE_CHECK_COUNT = 4
 # Interface between ADC and heater temperature callbacks
 class PrinterADCtoTemperature:
     def __init__(self, config, adc_convert):
+        self.name = config.get_name()
         self.adc_convert = adc_convert
+        self.calc_temp = adc_convert.calc_temp
+        self.lookup_table = None
+        table_size = config.getint('adc_lookup_table_size', 0, minval=0)
+        if table_size:
+            if table_size < 2:
+                raise config.error(
+                    "adc_lookup_table_size must be at least 2 in %s" % (
+                        self.name,))
+            self.lookup_table = ADCLookupTable(adc_convert, table_size)
+            self.calc_temp = self.lookup_table.calc_temp
         ppins = config.get_printer().lookup_object('pins')
         self.mcu_adc = ppins.setup_pin('adc', config.get('sensor_pin'))
         self.mcu_adc.setup_adc_callback(REPORT_TIME, self.adc_callback)
@@ -27,13 +38,52 @@ class PrinterADCtoTemperature:
     def get_report_time_delta(self):
         return REPORT_TIME
     def adc_callback(self, read_time, read_value):
-        temp = self.adc_convert.calc_temp(read_value)
+        temp = self.calc_temp(read_value)
         self.temperature_callback(read_time + SAMPLE_COUNT * SAMPLE_TIME, temp)
     def setup_minmax(self, min_temp, max_temp):
         adc_range = [self.adc_convert.calc_adc(t) for t in [min_temp, max_temp]]
         self.mcu_adc.setup_minmax(SAMPLE_TIME, SAMPLE_COUNT,
                                   minval=min(adc_range), maxval=max(adc_range),
                                   range_check_count=RANGE_CHECK_COUNT)
+        if self.lookup_table is not None:
+            max_error = self.lookup_table.check_accuracy(
+                min(adc_range), max(adc_range))
+            logging.info("%s: adc lookup table with %d entries"
+                         " (max error %.6f between %.1f and %.1f)",
+                         self.name, self.lookup_table.size, max_error,
+                         min_temp, max_temp)
+
+
+######################################################################
+# ADC lookup table
+######################################################################
+
+# Precalculated table of temperatures at evenly spaced adc values
+class ADCLookupTable:
+    def __init__(self, adc_convert, size):
+        self.adc_convert = adc_convert
+        self.size = size
+        self.scale = float(size - 1)
+        temps = [adc_convert.calc_temp(i / self.scale) for i in range(size)]
+        temps.append(temps[-1])
+        self.table = [(temps[i], temps[i+1] - temps[i]) for i in range(size)]
+    def calc_temp(self, adc):
+        # Linearly interpolate between the two nearest table entries
+        pos = max(0., min(self.scale, adc * self.scale))
+        index = int(pos)
+        temp, delta = self.table[index]
+        return temp + delta * (pos - index)
+    def check_accuracy(self, min_adc, max_adc):
+        # Find the largest error (compared to the exact conversion) at
+        # the midpoints between table entries in the given adc range
+        max_error = 0.
+        start = int(min_adc * self.scale)
+        end = min(int(max_adc * self.scale) + 1, self.size - 1)
+        for i in range(start, end):
+            adc = (i + .5) / self.scale
+            error = abs(self.calc_temp(adc) - self.adc_convert.calc_temp(adc))
+            max_error = max(max_error, error)
+        return max_error
 
 
 ######################################################################
@@ -53,25 +53,15 @@ class BedTiltCalibrate:
     def cmd_BED_TILT_CALIBRATE(self, params):
         self.probe_helper.start_probe(params)
     def probe_finalize(self, offsets, positions):
-        # Setup for coordinate descent analysis
+        # Find the best fit plane through the probed points
         z_offset = offsets[2]
         logging.info("Calculating bed_tilt with: %s", positions)
-        params = { 'x_adjust': self.bedtilt.x_adjust,
-                   'y_adjust': self.bedtilt.y_adjust,
-                   'z_adjust': z_offset }
-        logging.info("Initial bed_tilt parameters: %s", params)
-        # Perform coordinate descent
-        def adjusted_height(pos, params):
-            x, y, z = pos
-            return (z - x*params['x_adjust'] - y*params['y_adjust']
-                    - params['z_adjust'])
-        def errorfunc(params):
-            total_error = 0.
-            for pos in positions:
-                total_error += adjusted_height(pos, params)**2
-            return total_error
-        new_params = mathutil.coordinate_descent(
-            params.keys(), params, errorfunc)
+        try:
+            fit = mathutil.plane_fit(positions)
+        except ZeroDivisionError:
+            raise self.gcode.error(
+                "Unable to calculate bed tilt - probe points are collinear")
+        new_params = dict(zip(('x_adjust', 'y_adjust', 'z_adjust'), fit))
         # Update current bed_tilt calculations
         x_adjust = new_params['x_adjust']
         y_adjust = new_params['y_adjust']
@@ -81,9 +71,6 @@ class BedTiltCalibrate:
         self.gcode.reset_last_position()
         # Log and report results
         logging.info("Calculated bed_tilt parameters: %s", new_params)
-        for pos in positions:
-            logging.info("orig: %s new: %s", adjusted_height(pos, params),
-                         adjusted_height(pos, new_params))
         msg = "x_adjust: %.6f y_adjust: %.6f z_adjust: %.6f" % (
             x_adjust, y_adjust, z_adjust)
         self.printer.set_rollover_info("bed_tilt", "bed_tilt: %s" % (msg,))
@@ -141,6 +141,11 @@ class BLTouchEndstopWrapper:
         # Test was successful
         self.next_test_time = check_end_time + TEST_TIME
         self.sync_print_time()
+    def multi_probe_begin(self):
+        # The BLTouch pin must be raised after each trigger
+        pass
+    def multi_probe_end(self):
+        pass
     def home_prepare(self):
         self.test_sensor()
         self.sync_print_time()
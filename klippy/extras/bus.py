@@ -68,6 +68,8 @@ class MCU_SPI:
         self.cmd_queue = self.mcu.alloc_command_queue()
         self.mcu.register_config_callback(self.build_config)
         self.spi_send_cmd = self.spi_transfer_cmd = None
+        # Only one query may wait for a response at a time
+        self.transfer_mutex = mcu.get_printer().get_reactor().mutex()
     def get_oid(self):
         return self.oid
     def get_mcu(self):
@@ -95,8 +97,15 @@ class MCU_SPI:
         self.spi_send_cmd.send([self.oid, data],
                                minclock=minclock, reqclock=reqclock)
     def spi_transfer(self, data):
-        return self.spi_transfer_cmd.send_with_response(
-            [self.oid, data], 'spi_transfer_response', self.oid)
+        with self.transfer_mutex:
+            return self.spi_transfer_cmd.send_with_response(
+                [self.oid, data], 'spi_transfer_response', self.oid)
+    def spi_transfer_batch(self, data_list):
+        # Send several transfers together and wait for all responses
+        with self.transfer_mutex:
+            return self.spi_transfer_cmd.send_batch_with_response(
+                [[self.oid, data] for data in data_list],
+                'spi_transfer_response', self.oid)
 
 # Helper to setup an spi bus from settings in a config section
 def MCU_SPI_from_config(config, mode, pin_option="cs_pin",
@@ -3,7 +3,7 @@
 # Copyright (C) 2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging
+import logging, collections
 
 QUERY_TIME = .002
 RETRANSMIT_COUNT = 50
@@ -53,7 +53,11 @@ class MCU_buttons:
         self.invert = self.last_button = 0
         self.ack_cmd = None
         self.ack_count = 0
-    def setup_buttons(self, pins, callback):
+        # Button states received from the mcu, but not yet processed
+        self.pending_buttons = collections.deque()
+        self.pending_scheduled = False
+        self.batch_count = self.button_count = 0
+    def setup_buttons(self, pins, callback, batch=False):
         mask = 0
         shift = len(self.pin_list)
         for pin_params in pins:
@@ -61,7 +65,7 @@ class MCU_buttons:
                 self.invert |= 1 << len(self.pin_list)
             mask |= 1 << len(self.pin_list)
             self.pin_list.append((pin_params['pin'], pin_params['pullup']))
-        self.callbacks.append((mask, shift, callback))
+        self.callbacks.append((mask, shift, callback, batch))
     def build_config(self):
         if not self.pin_list:
             return
@@ -99,17 +103,44 @@ class MCU_buttons:
         # Send ack to MCU
         self.ack_cmd.send([self.oid, new_count])
         self.ack_count += new_count
-        # Call self.handle_button() with this event in main thread
-        for b in new_buttons:
-            self.reactor.register_async_callback(
-                (lambda e, s=self, b=ord(b): s.handle_button(e, b)))
-    def handle_button(self, eventtime, button):
-        button ^= self.invert
-        changed = button ^ self.last_button
-        for mask, shift, callback in self.callbacks:
-            if changed & mask:
-                callback(eventtime, (button & mask) >> shift)
-        self.last_button = button
+        # Queue the new states and process them all in the main thread
+        receive_time = params['#receive_time']
+        self.pending_buttons.extend([(receive_time, ord(b))
+                                     for b in new_buttons])
+        if not self.pending_scheduled:
+            self.pending_scheduled = True
+            self.reactor.register_async_callback(self.handle_pending)
+    def handle_pending(self, eventtime):
+        # Clear the flag first so that states queued while draining
+        # schedule a new callback
+        self.pending_scheduled = False
+        pending = self.pending_buttons
+        buttons = []
+        while pending:
+            buttons.append(pending.popleft())
+        if buttons:
+            self.handle_buttons(eventtime, buttons)
+    def handle_buttons(self, eventtime, buttons):
+        self.batch_count += 1
+        self.button_count += len(buttons)
+        # Find the state changes of each callback
+        invert = self.invert
+        for mask, shift, callback, batch in self.callbacks:
+            last_button = self.last_button
+            states = []
+            for receive_time, button in buttons:
+                button ^= invert
+                if (button ^ last_button) & mask:
+                    states.append((receive_time, (button & mask) >> shift))
+                last_button = button
+            if not states:
+                continue
+            if batch:
+                callback(eventtime, states)
+            else:
+                for receive_time, state in states:
+                    callback(eventtime, state)
+        self.last_button = buttons[-1] ^ invert
 
 
 ######################################################################
@@ -121,13 +152,18 @@ class RotaryEncoder:
         self.cw_callback = cw_callback
         self.ccw_callback = ccw_callback
         self.encoder_state = R_START
-    def encoder_callback(self, eventtime, state):
-        es = ENCODER_STATES[self.encoder_state & 0xf][state & 0x3]
+    def encoder_callback(self, eventtime, states):
+        # Run the state machine over a batch of states.  Each step is
+        # reported with the time its state was received from the mcu,
+        # so step rate checks are not affected by the batching.
+        es = self.encoder_state
+        for receive_time, state in states:
+            es = ENCODER_STATES[es & 0xf][state & 0x3]
+            if es & R_DIR_MSK == R_DIR_CW:
+                self.cw_callback(receive_time)
+            elif es & R_DIR_MSK == R_DIR_CCW:
+                self.ccw_callback(receive_time)
         self.encoder_state = es
-        if es & R_DIR_MSK == R_DIR_CW:
-            self.cw_callback(eventtime)
-        elif es & R_DIR_MSK == R_DIR_CCW:
-            self.ccw_callback(eventtime)
 
 
 ######################################################################
@@ -138,7 +174,7 @@ class PrinterButtons:
     def __init__(self, config):
         self.printer = config.get_printer()
         self.mcu_buttons = {}
-    def register_buttons(self, pins, callback):
+    def register_buttons(self, pins, callback, batch=False):
         # Parse pins
         ppins = self.printer.lookup_object('pins')
         mcu = mcu_name = None
@@ -156,15 +192,22 @@ class PrinterButtons:
             or len(mcu_buttons.pin_list) + len(pin_params_list) > 8):
             self.mcu_buttons[mcu_name] = mcu_buttons = MCU_buttons(
                 self.printer, mcu)
-        mcu_buttons.setup_buttons(pin_params_list, callback)
+        mcu_buttons.setup_buttons(pin_params_list, callback, batch)
     def register_rotary_encoder(self, pin1, pin2, cw_callback, ccw_callback):
         re = RotaryEncoder(cw_callback, ccw_callback)
-        self.register_buttons([pin1, pin2], re.encoder_callback)
+        self.register_buttons([pin1, pin2], re.encoder_callback, batch=True)
     def register_button_push(self, pin, callback):
         def helper(eventtime, state, callback=callback):
             if state:
                 callback(eventtime)
         self.register_buttons([pin], helper)
+    def stats(self, eventtime):
+        if not self.mcu_buttons:
+            return False, ""
+        mcu_buttons = self.mcu_buttons.values()
+        return False, "buttons: batches=%d states=%d" % (
+            sum([mb.batch_count for mb in mcu_buttons]),
+            sum([mb.button_count for mb in mcu_buttons]))
 
 def load_config(config):
     return PrinterButtons(config)
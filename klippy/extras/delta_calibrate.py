@@ -202,7 +202,7 @@ class DeltaCalibrate:
         # Perform analysis
         self.calculate_params(probe_positions, self.last_distances)
     def calculate_params(self, probe_positions, distances):
-        # Setup for coordinate descent analysis
+        # Setup for least squares analysis
         kin = self.printer.lookup_object('toolhead').get_kinematics()
         params = kin.get_calibrate_params()
         orig_delta_params = build_delta_params(params)
@@ -215,25 +215,25 @@ class DeltaCalibrate:
         if distances:
             adj_params += ('arm_a', 'arm_b', 'arm_c')
             z_weight = len(distances) / (MEASURE_WEIGHT * len(probe_positions))
-        # Perform coordinate descent
-        def delta_errorfunc(params):
+        # Perform least squares analysis
+        z_scale = math.sqrt(z_weight)
+        def delta_residuals(params):
             # Build new delta_params for params under test
             delta_params = build_delta_params(params)
             # Calculate z height errors
-            total_error = 0.
+            residuals = []
             for z_offset, stable_pos in probe_positions:
                 x, y, z = get_position_from_stable(stable_pos, delta_params)
-                total_error += (z - z_offset)**2
-            total_error *= z_weight
+                residuals.append((z - z_offset) * z_scale)
             # Calculate distance errors
             for dist, stable_pos1, stable_pos2 in distances:
                 x1, y1, z1 = get_position_from_stable(stable_pos1, delta_params)
                 x2, y2, z2 = get_position_from_stable(stable_pos2, delta_params)
                 d = math.sqrt((x1-x2)**2 + (y1-y2)**2 + (z1-z2)**2)
-                total_error += (d - dist)**2
-            return total_error
-        new_params = mathutil.background_coordinate_descent(
-            self.printer, adj_params, params, delta_errorfunc)
+                residuals.append(d - dist)
+            return residuals
+        new_params, solve_info = mathutil.background_levenberg_marquardt(
+            self.printer, adj_params, params, delta_residuals)
         # Log and report results
         logging.info("Calculated delta_calibrate parameters: %s", new_params)
         new_delta_params = build_delta_params(new_params)
@@ -256,6 +256,7 @@ class DeltaCalibrate:
             "stepper_b: position_endstop: %.6f angle: %.6f arm: %.6f\n"
             "stepper_c: position_endstop: %.6f angle: %.6f arm: %.6f\n"
             "delta_radius: %.6f\n"
+            "Solved in %d iterations (error %.9f) in %.3f seconds\n"
             "The SAVE_CONFIG command will update the printer config file\n"
             "with these parameters and restart the printer." % (
                 new_params['endstop_a'], new_params['angle_a'],
@@ -264,7 +265,8 @@ class DeltaCalibrate:
                 new_params['arm_b'],
                 new_params['endstop_c'], new_params['angle_c'],
                 new_params['arm_c'],
-                new_params['radius']))
+                new_params['radius'], solve_info['iterations'],
+                solve_info['error'], solve_info['time']))
         # Store results for SAVE_CONFIG
         self.save_state(probe_positions, distances, new_params)
     cmd_DELTA_CALIBRATE_help = "Delta calibration script"
@@ -5,13 +5,13 @@
 # Copyright (C) 2018  Eric Callahan <arksine.code@gmail.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging
-import hd44780, st7920, uc1701
-import menu
+import logging, importlib
+import menu, framebuffer
 
+# Chip modules are only imported when selected (some load large fonts)
 LCD_chips = {
-    'st7920': st7920.ST7920, 'hd44780': hd44780.HD44780,
-    'uc1701' : uc1701.UC1701, 'ssd1306': uc1701.SSD1306,
+    'st7920': ('st7920', 'ST7920'), 'hd44780': ('hd44780', 'HD44780'),
+    'uc1701' : ('uc1701', 'UC1701'), 'ssd1306': ('uc1701', 'SSD1306'),
 }
 M73_TIMEOUT = 5.
 
@@ -19,8 +19,11 @@ class PrinterLCD:
     def __init__(self, config):
         self.printer = config.get_printer()
         self.reactor = self.printer.get_reactor()
-        self.lcd_chip = config.getchoice('lcd_type', LCD_chips)(config)
+        mod_name, class_name = config.getchoice('lcd_type', LCD_chips)
+        mod = importlib.import_module('extras.display.' + mod_name)
+        self.lcd_chip = getattr(mod, class_name)(config)
         self.lcd_type = config.get('lcd_type')
+        self.snapshot = self.printer.try_load_module(config, 'status_snapshot')
         # menu
         self.menu = menu.MenuManager(config, self.lcd_chip)
         # printer objects
@@ -53,6 +56,13 @@ class PrinterLCD:
     # Get menu instance
     def get_menu(self):
         return self.menu
+    def stats(self, eventtime):
+        flushes, updates, sent_bytes = framebuffer.get_stats(
+            self.lcd_chip.get_framebuffers())
+        return False, "display: flushes=%d updates=%d bytes=%d" % (
+            flushes, updates, sent_bytes)
+    def _get_status(self, name, obj, eventtime):
+        return self.snapshot.get_status('display', name, obj, eventtime)
     # Graphics drawing
     def animate_glyphs(self, eventtime, x, y, glyph_name, do_animate):
         frame = do_animate and int(eventtime) & 1
@@ -92,29 +102,31 @@ class PrinterLCD:
         lcd_chip = self.lcd_chip
         # Heaters
         if self.extruder0 is not None:
-            info = self.extruder0.get_heater().get_status(eventtime)
+            info = self._get_status('extruder0', self.extruder0.get_heater(),
+                                    eventtime)
             lcd_chip.write_glyph(0, 0, 'extruder')
             self.draw_heater(1, 0, info)
         if self.extruder1 is not None:
-            info = self.extruder1.get_heater().get_status(eventtime)
+            info = self._get_status('extruder1', self.extruder1.get_heater(),
+                                    eventtime)
             lcd_chip.write_glyph(0, 1, 'extruder')
             self.draw_heater(1, 1, info)
         if self.heater_bed is not None:
-            info = self.heater_bed.get_status(eventtime)
+            info = self._get_status('heater_bed', self.heater_bed, eventtime)
             lcd_chip.write_glyph(10, 0, 'bed')
             self.draw_heater(11, 0, info)
         # Fan speed
         if self.fan is not None:
-            info = self.fan.get_status(eventtime)
+            info = self._get_status('fan', self.fan, eventtime)
             lcd_chip.write_text(10, 1, "Fan")
             self.draw_percent(14, 1, 4, info['speed'])
         # G-Code speed factor
-        gcode_info = self.gcode.get_status(eventtime)
+        gcode_info = self._get_status('gcode', self.gcode, eventtime)
         lcd_chip.write_glyph(0, 2, 'feedrate')
         self.draw_percent(1, 2, 4, gcode_info['speed_factor'])
         # Print progress
         progress = None
-        toolhead_info = self.toolhead.get_status(eventtime)
+        toolhead_info = self._get_status('toolhead', self.toolhead, eventtime)
         if self.progress is not None:
             progress = self.progress / 100.
             lcd_chip.write_glyph(8, 2, 'usb')
@@ -124,7 +136,7 @@ class PrinterLCD:
                 if self.prg_time <= 0.:
                     self.progress = None
         elif self.sdcard is not None:
-            info = self.sdcard.get_status(eventtime)
+            info = self._get_status('virtual_sdcard', self.sdcard, eventtime)
             progress = info['progress']
             lcd_chip.write_glyph(8, 2, 'sd')
         if progress is not None:
@@ -135,17 +147,19 @@ class PrinterLCD:
     def screen_update_128x64(self, eventtime):
         # Heaters
         if self.extruder0 is not None:
-            info = self.extruder0.get_heater().get_status(eventtime)
+            info = self._get_status('extruder0', self.extruder0.get_heater(),
+                                    eventtime)
             self.lcd_chip.write_glyph(0, 0, 'extruder')
             self.draw_heater(2, 0, info)
         extruder_count = 1
         if self.extruder1 is not None:
-            info = self.extruder1.get_heater().get_status(eventtime)
+            info = self._get_status('extruder1', self.extruder1.get_heater(),
+                                    eventtime)
             self.lcd_chip.write_glyph(0, 1, 'extruder')
             self.draw_heater(2, 1, info)
             extruder_count = 2
         if self.heater_bed is not None:
-            info = self.heater_bed.get_status(eventtime)
+            info = self._get_status('heater_bed', self.heater_bed, eventtime)
             if info['target']:
                 self.animate_glyphs(eventtime, 0, extruder_count,
                                     'bed_heat', True)
@@ -154,12 +168,12 @@ class PrinterLCD:
             self.draw_heater(2, extruder_count, info)
         # Fan speed
         if self.fan is not None:
-            info = self.fan.get_status(eventtime)
+            info = self._get_status('fan', self.fan, eventtime)
             self.animate_glyphs(eventtime, 10, 0, 'fan', info['speed'] != 0.)
             self.draw_percent(12, 0, 4, info['speed'], '>')
         # SD card print progress
         progress = None
-        toolhead_info = self.toolhead.get_status(eventtime)
+        toolhead_info = self._get_status('toolhead', self.toolhead, eventtime)
         if self.progress is not None:
             progress = self.progress / 100.
             if toolhead_info['status'] != "Printing":
@@ -168,7 +182,7 @@ class PrinterLCD:
                 if self.prg_time <= 0.:
                     self.progress = None
         elif self.sdcard is not None:
-            info = self.sdcard.get_status(eventtime)
+            info = self._get_status('virtual_sdcard', self.sdcard, eventtime)
             progress = info['progress']
         if progress is not None:
             if extruder_count == 1:
@@ -178,7 +192,7 @@ class PrinterLCD:
             self.draw_percent(x, y, width, progress, '^')
             self.draw_progress_bar(x, y, width, progress)
         # G-Code speed factor
-        gcode_info = self.gcode.get_status(eventtime)
+        gcode_info = self._get_status('gcode', self.gcode, eventtime)
         if extruder_count == 1:
             self.lcd_chip.write_glyph(10, 1, 'feedrate')
             self.draw_percent(12, 1, 4, gcode_info['speed_factor'], '>')
@@ -0,0 +1,97 @@
+# Framebuffer with dirty region tracking for LCD displays
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+class Framebuffer:
+    def __init__(self, size, fill=' ', merge_gap=5, max_merge=16,
+                 align=1):
+        self.data = bytearray(fill * size)
+        self.blank = bytearray(self.data)
+        # Contents of the chip memory (unknown at start)
+        self.chip_data = bytearray('~' * size)
+        self.merge_gap = merge_gap
+        self.max_merge = max_merge
+        self.align = align
+        # Regions drawn since the last clear
+        self.drawn = [(0, size)]
+        self.add_drawn = self.drawn.append
+        # Regions drawn before the last clear (and not yet flushed)
+        self.cleared = []
+        # Statistics
+        self.flush_count = self.update_count = self.update_bytes = 0
+    def mark_dirty(self, start, end):
+        # Note a region of self.data that was modified directly
+        if start < end:
+            self.add_drawn((start, end))
+    def write(self, pos, data):
+        end = pos + len(data)
+        self.data[pos:end] = data
+        self.add_drawn((pos, end))
+    def clear(self):
+        # Everything outside the drawn regions is already blank
+        drawn = self.drawn
+        if drawn:
+            self.data[:] = self.blank
+            self.cleared.extend(drawn)
+            del drawn[:]
+    def invalidate(self, start, end):
+        # Force retransmission of a region on the next flush
+        for i in range(start, end):
+            self.chip_data[i] = self.data[i] ^ 1
+        self.add_drawn((start, end))
+    def get_updates(self):
+        # Return list of (pos, count) regions that must be sent to the chip
+        self.flush_count += 1
+        cleared = self.cleared
+        self.cleared = []
+        data, chip_data = self.data, self.chip_data
+        if data == chip_data:
+            # Nothing changed (eg, an identical redraw)
+            return []
+        # Only diff the drawn (or cleared) regions that changed
+        spans = [(s, e) for s, e in cleared + self.drawn
+                 if data[s:e] != chip_data[s:e]]
+        drawn = self.drawn
+        if len(drawn) > 256:
+            # Framebuffer is not being cleared - limit tracking overhead
+            start, end = min(drawn)[0], max([e for s, e in drawn])
+            del drawn[:]
+            self.add_drawn((start, end))
+        # Find the position of all changed bytes in the dirty regions
+        diffs = []
+        prev_end = 0
+        for start, end in sorted(spans):
+            if end <= prev_end:
+                continue
+            start = max(start, prev_end)
+            prev_end = end
+            new_data = data[start:end]
+            diffs.extend([[start + i, 1]
+                          for i, (n, o) in enumerate(zip(
+                              new_data, chip_data[start:end])) if n != o])
+            chip_data[start:end] = new_data
+        # Batch together changes that are close to each other
+        merge_gap, max_merge = self.merge_gap, self.max_merge
+        for i in range(len(diffs)-2, -1, -1):
+            pos, count = diffs[i]
+            nextpos, nextcount = diffs[i+1]
+            if pos + merge_gap >= nextpos and nextcount < max_merge:
+                diffs[i][1] = nextcount + (nextpos - pos)
+                del diffs[i+1]
+        if self.align > 1:
+            # Expand regions to the chip's transfer alignment
+            mask = self.align - 1
+            for diff in diffs:
+                pos, count = diff
+                diff[0] = pos & ~mask
+                diff[1] = ((pos + count + mask) & ~mask) - diff[0]
+        self.update_count += len(diffs)
+        self.update_bytes += sum([count for pos, count in diffs])
+        return diffs
+
+def get_stats(framebuffers):
+    # Return (flushes, updates, bytes) totals for a set of framebuffers
+    flushes = max([fb.flush_count for fb in framebuffers] + [0])
+    updates = sum([fb.update_count for fb in framebuffers])
+    sent_bytes = sum([fb.update_bytes for fb in framebuffers])
+    return flushes, updates, sent_bytes
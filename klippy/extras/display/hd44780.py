@@ -5,6 +5,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
+import framebuffer
 
 BACKGROUND_PRIORITY_CLOCK = 0x7fffffff00000000
 
@@ -28,13 +29,14 @@ class HD44780:
         self.mcu.register_config_callback(self.build_config)
         self.send_data_cmd = self.send_cmds_cmd = None
         # framebuffers
-        self.text_framebuffer = bytearray(' '*80)
-        self.glyph_framebuffer = bytearray(64)
+        self.text_framebuffer = framebuffer.Framebuffer(80, merge_gap=4)
+        self.glyph_framebuffer = framebuffer.Framebuffer(64, '\0',
+                                                         merge_gap=4)
         self.all_framebuffers = [
             # Text framebuffer
-            (self.text_framebuffer, bytearray('~'*80), 0x80),
+            (self.text_framebuffer, 0x80),
             # Glyph framebuffer
-            (self.glyph_framebuffer, bytearray('~'*64), 0x40) ]
+            (self.glyph_framebuffer, 0x40) ]
     def build_config(self):
         self.mcu.add_config_cmd(
             "config_hd44780 oid=%d rs_pin=%s e_pin=%s"
@@ -54,28 +56,16 @@ class HD44780:
         cmd_type.send([self.oid, cmds], reqclock=BACKGROUND_PRIORITY_CLOCK)
         #logging.debug("hd44780 %d %s", is_data, repr(cmds))
     def flush(self):
-        # Find all differences in the framebuffers and send them to the chip
-        for new_data, old_data, fb_id in self.all_framebuffers:
-            if new_data == old_data:
-                continue
-            # Find the position of all changed bytes in this framebuffer
-            diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
-                     if n != o]
-            # Batch together changes that are close to each other
-            for i in range(len(diffs)-2, -1, -1):
-                pos, count = diffs[i]
-                nextpos, nextcount = diffs[i+1]
-                if pos + 4 >= nextpos and nextcount < 16:
-                    diffs[i][1] = nextcount + (nextpos - pos)
-                    del diffs[i+1]
-            # Transmit changes
-            for pos, count in diffs:
+        # Send all changed regions of the framebuffers to the chip
+        for fb, fb_id in self.all_framebuffers:
+            for pos, count in fb.get_updates():
                 chip_pos = pos
                 if fb_id == 0x80 and pos >= 40:
                     chip_pos += 0x40 - 40
                 self.send([fb_id + chip_pos])
-                self.send(new_data[pos:pos+count], is_data=True)
-            old_data[:] = new_data
+                self.send(fb.data[pos:pos+count], is_data=True)
+    def get_framebuffers(self):
+        return [fb for fb, fb_id in self.all_framebuffers]
     def init(self):
         curtime = self.printer.get_reactor().monotonic()
         print_time = self.mcu.estimated_print_time(curtime)
@@ -87,15 +77,14 @@ class HD44780:
             minclock = self.mcu.print_time_to_clock(print_time + i * .100)
             self.send_cmds_cmd.send([self.oid, cmds], minclock=minclock)
         # Add custom fonts
-        self.glyph_framebuffer[:len(HD44780_chars)] = HD44780_chars
-        for i in range(len(self.glyph_framebuffer)):
-            self.all_framebuffers[1][1][i] = self.glyph_framebuffer[i] ^ 1
+        self.glyph_framebuffer.write(0, HD44780_chars)
+        self.glyph_framebuffer.invalidate(0, 64)
         self.flush()
     def write_text(self, x, y, data):
         if x + len(data) > 20:
             data = data[:20 - min(x, 20)]
         pos = [0, 40, 20, 60][y] + x
-        self.text_framebuffer[pos:pos+len(data)] = data
+        self.text_framebuffer.write(pos, data)
     def write_glyph(self, x, y, glyph_name):
         char = TextGlyphs.get(glyph_name)
         if char is not None:
@@ -104,7 +93,7 @@ class HD44780:
             return 1
         return 0
     def clear(self):
-        self.text_framebuffer[:] = ' '*80
+        self.text_framebuffer.clear()
     def get_dimensions(self):
         return (20, 4)
 
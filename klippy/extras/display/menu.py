@@ -12,6 +12,12 @@ class error(Exception):
     pass
 
 
+# Parsed "enable"/"readonly" expressions and parameter names (shared by
+# all menu items as these are evaluated on every screen update)
+parsed_bools = {}
+parsed_parameters = {}
+
+
 # static class for cursor
 class MenuCursor:
     NONE = ' '
@@ -120,11 +126,14 @@ class MenuElement(object):
         return s
 
     def _parse_bool(self, lst):
+        key = tuple(lst)
+        words = parsed_bools.get(key)
+        if words is None:
+            words = [self._words_aslist(l1) for l1 in lst]
+            parsed_bools[key] = words
         try:
             return any([
-                all([
-                    self._lookup_bool(l2) for l2 in self._words_aslist(l1)
-                ]) for l1 in lst
+                all([self._lookup_bool(l2) for l2 in l1]) for l1 in words
             ])
         except Exception:
             logging.exception("Boolean parsing error")
@@ -139,18 +148,21 @@ class MenuElement(object):
         return True
 
     def _lookup_parameter(self, literal):
-        if self._isfloat(literal):
-            return float(literal)
-        else:
-            # only 2 level dot notation
-            keys = literal.rsplit('.', 1)
-            name = keys[0] if keys[0:1] else None
-            attr = keys[1] if keys[1:2] else None
-            if isinstance(self._manager.parameters, dict):
-                return (self._manager.parameters.get(name) or {}).get(attr)
+        parsed = parsed_parameters.get(literal)
+        if parsed is None:
+            if self._isfloat(literal):
+                parsed = (float(literal), None, None)
             else:
-                logging.error("Parameter storage is not dictionary")
-        return None
+                # only 2 level dot notation
+                keys = literal.rsplit('.', 1)
+                name = keys[0] if keys[0:1] else None
+                attr = keys[1] if keys[1:2] else None
+                parsed = (None, name, attr)
+            parsed_parameters[literal] = parsed
+        value, name, attr = parsed
+        if name is None:
+            return value
+        return (self._manager.parameters.get(name) or {}).get(attr)
 
     def _asliteral(self, s):
         s = str(s).strip()
@@ -328,6 +340,10 @@ class MenuItem(MenuElement):
         super(MenuItem, self).__init__(manager, config, namespace)
         self.parameter = config.get('parameter', '')
         self.transform = config.get('transform', '')
+        # Cached parsing and rendering results
+        self._parameter_names = self._transforms = None
+        self._last_values = (None, None)
+        self._formatted = {}
 
     def _parse_transform(self, t):
         flist = {
@@ -434,37 +450,55 @@ class MenuItem(MenuElement):
         return fn
 
     def _transform_aslist(self):
-        return list(filter(None, (
-            self._parse_transform(t) for t in self._aslist(
-                self.transform, flatten=False)
-        )))
+        if self._transforms is None:
+            self._transforms = list(filter(None, (
+                self._parse_transform(t) for t in self._aslist(
+                    self.transform, flatten=False)
+            )))
+        return self._transforms
 
     def _parameter_aslist(self):
+        if self._parameter_names is None:
+            self._parameter_names = self._words_aslist(self.parameter)
         lst = []
-        for p in self._words_aslist(self.parameter):
+        for p in self._parameter_names:
             lst.append(self._lookup_parameter(p))
             if lst[-1] is None:
                 logging.error("Parameter '%s' not found" % str(p))
         return list(lst)
 
     def _prepare_values(self, value=None):
+        params = self._parameter_aslist()
+        # Transforms only need to run when the parameters change
+        last_key, last_values = self._last_values
+        if last_key == (params, value):
+            return last_values
         values = []
-        for i, v in enumerate(self._parameter_aslist()):
+        for i, v in enumerate(params):
             values += [value if i == 0 and value is not None else v]
         if values:
             try:
                 values += [t(list(values)) for t in self._transform_aslist()]
             except Exception:
                 logging.exception("Transformation execution failed")
-        return tuple(values)
+        values = tuple(values)
+        self._last_values = ((params, value), values)
+        return values
 
     def _get_formatted(self, literal, val=None):
         values = self._prepare_values(val)
         if isinstance(literal, str) and len(values) > 0:
+            # Reuse the last output if the values have not changed
+            last = self._formatted.get(literal)
+            if last is not None and last[0] == values:
+                return last[1]
+            output = literal
             try:
-                literal = literal.format(*values)
+                output = literal.format(*values)
             except Exception:
                 logging.exception("Literal formatting failed")
+            self._formatted[literal] = (values, output)
+            return output
         return literal
 
     def _render(self):
@@ -835,6 +869,7 @@ class MenuCard(MenuGroup):
             config.get('allow_without_selection', 'true'))
         if not self.items:
             self.content = self._parse_content_items(self.content)
+        self._content_lines = None
 
     def _parse_content_items(self, content):
         formatter = string.Formatter()
@@ -864,9 +899,11 @@ class MenuCard(MenuGroup):
         return self._lines_aslist(self.items)
 
     def _content_aslist(self):
-        return filter(None, [
-            self._asliteral(s) for s in self._lines_aslist(self.content)
-        ])
+        if self._content_lines is None:
+            self._content_lines = filter(None, [
+                self._asliteral(s) for s in self._lines_aslist(self.content)
+            ])
+        return self._content_lines
 
     def update_items(self):
         self._items = self._allitems[:]
@@ -968,6 +1005,30 @@ BLINK_FAST_SEQUENCE = (True, True, False, False)
 BLINK_SLOW_SEQUENCE = (True, True, True, True, False, False, False)
 
 
+# Menu parameters of the printer objects (each object's parameters are
+# only built when first read by a menu item)
+class MenuParameters:
+    def __init__(self, manager, eventtime):
+        self.manager = manager
+        self.eventtime = eventtime
+        self.cache = {}
+    def get(self, name, default=None):
+        if name not in self.manager.objs:
+            return default
+        if name not in self.cache:
+            self.cache[name] = self.manager.build_parameters(
+                name, self.eventtime)
+        return self.cache[name]
+    def __getitem__(self, name):
+        if name not in self.manager.objs:
+            raise KeyError(name)
+        return self.get(name)
+    def __contains__(self, name):
+        return name in self.manager.objs
+    def __iter__(self):
+        return iter(sorted(self.manager.objs.keys()))
+
+
 class MenuManager:
     def __init__(self, config, lcd_chip):
         self.running = False
@@ -982,12 +1043,25 @@ class MenuManager:
         self.blink_slow_idx = 0
         self.timeout_idx = 0
         self.lcd_chip = lcd_chip
+        # Lines currently on the display (None if not drawn by the menu)
+        self.screen_lines = None
+        self.update_count = self.redraw_count = 0
+        self.update_time = 0.
         self.printer = config.get_printer()
         self.pconfig = self.printer.lookup_object('configfile')
         self.gcode = self.printer.lookup_object('gcode')
         self.gcode_queue = []
         self.parameters = {}
         self.objs = {}
+        self.snapshot = self.printer.try_load_module(config, 'status_snapshot')
+        self.parameter_extras = {
+            'ToolHead': self._toolhead_parameters,
+            'PrinterExtruder': self._extruder_parameters,
+            'PrinterLCD': self._lcd_parameters,
+            'PrinterHeaterFan': self._heater_fan_parameters,
+            'PrinterOutputPin': self._output_pin_parameters,
+            'PrinterServo': self._output_pin_parameters,
+        }
         self.root = None
         self._root = config.get('menu_root', '__main')
         self.cols, self.rows = lcd_chip.get_dimensions()
@@ -1170,61 +1244,50 @@ class MenuManager:
         }
 
     def update_parameters(self, eventtime):
-        self.parameters = {}
-        objs = dict(self.objs)
-        # getting info this way is more like hack
-        # all modules should have special reporting method (maybe get_status)
-        # for available parameters
-        # Only 2 level dot notation
-        for name in objs.keys():
-            try:
-                if objs[name] is not None:
-                    class_name = str(objs[name].__class__.__name__)
-                    get_status = getattr(objs[name], "get_status", None)
-                    if callable(get_status):
-                        self.parameters[name] = get_status(eventtime)
-                    else:
-                        self.parameters[name] = {}
-
-                    self.parameters[name].update({'is_enabled': True})
-                    # get additional info
-                    if class_name == 'ToolHead':
-                        pos = objs[name].get_position()
-                        self.parameters[name].update({
-                            'xpos': pos[0],
-                            'ypos': pos[1],
-                            'zpos': pos[2],
-                            'epos': pos[3]
-                        })
-                        self.parameters[name].update({
-                            'is_printing': (
-                                self.parameters[name]['status'] == "Printing"),
-                            'is_ready': (
-                                self.parameters[name]['status'] == "Ready"),
-                            'is_idle': (
-                                self.parameters[name]['status'] == "Idle")
-                        })
-                    elif class_name == 'PrinterExtruder':
-                        info = objs[name].get_heater().get_status(
-                            eventtime)
-                        self.parameters[name].update(info)
-                    elif class_name == 'PrinterLCD':
-                        self.parameters[name].update({
-                            'progress': objs[name].progress or 0,
-                            'message': objs[name].message or '',
-                            'is_enabled': True
-                        })
-                    elif class_name == 'PrinterHeaterFan':
-                        info = objs[name].fan.get_status(eventtime)
-                        self.parameters[name].update(info)
-                    elif class_name in ('PrinterOutputPin', 'PrinterServo'):
-                        self.parameters[name].update({
-                            'value': objs[name].last_value
-                        })
-                else:
-                    self.parameters[name] = {'is_enabled': False}
-            except Exception:
-                logging.exception("Parameter '%s' update error" % str(name))
+        self.parameters = MenuParameters(self, eventtime)
+
+    def build_parameters(self, name, eventtime):
+        obj = self.objs[name]
+        params = {}
+        try:
+            if hasattr(obj, 'get_status'):
+                params.update(self.snapshot.get_status(
+                    'menu', name, obj, eventtime))
+            params['is_enabled'] = True
+            # get additional info
+            extra = self.parameter_extras.get(obj.__class__.__name__)
+            if extra is not None:
+                params.update(extra(name, obj, params, eventtime))
+        except Exception:
+            logging.exception("Parameter '%s' update error" % str(name))
+        return params
+
+    def _toolhead_parameters(self, name, obj, params, eventtime):
+        pos = obj.get_position()
+        return {
+            'xpos': pos[0], 'ypos': pos[1], 'zpos': pos[2], 'epos': pos[3],
+            'is_printing': params['status'] == "Printing",
+            'is_ready': params['status'] == "Ready",
+            'is_idle': params['status'] == "Idle"
+        }
+
+    def _extruder_parameters(self, name, obj, params, eventtime):
+        return self.snapshot.get_status(
+            'menu', name + '.heater', obj.get_heater(), eventtime)
+
+    def _lcd_parameters(self, name, obj, params, eventtime):
+        return {
+            'progress': obj.progress or 0,
+            'message': obj.message or '',
+            'is_enabled': True
+        }
+
+    def _heater_fan_parameters(self, name, obj, params, eventtime):
+        return self.snapshot.get_status(
+            'menu', name + '.fan', obj.fan, eventtime)
+
+    def _output_pin_parameters(self, name, obj, params, eventtime):
+        return {'value': obj.last_value}
 
     def stack_push(self, container):
         if not isinstance(container, MenuContainer):
@@ -1320,19 +1383,45 @@ class MenuManager:
                     lines.append(s.ljust(self.cols))
         return lines
 
+    def draw_lines(self, lines):
+        # Only write the lines that changed since the last update
+        last_lines = self.screen_lines
+        if last_lines is None:
+            self.lcd_chip.clear()
+            last_lines = []
+        elif lines == last_lines:
+            return
+        self.redraw_count += 1
+        for y in range(max(len(lines), len(last_lines))):
+            line = lines[y] if y < len(lines) else ''
+            if y < len(last_lines) and line == last_lines[y]:
+                continue
+            text = self._unescape_cchars(line)
+            self.lcd_chip.write_text(0, y, text.ljust(self.cols))
+        self.lcd_chip.flush()
+        self.screen_lines = lines
+
     def screen_update_event(self, eventtime):
         if self.is_running():
-            self.lcd_chip.clear()
-            for y, line in enumerate(self.render(eventtime)):
-                self.lcd_chip.write_text(0, y, self._unescape_cchars(line))
-            self.lcd_chip.flush()
+            reactor = self.printer.get_reactor()
+            start_time = reactor.monotonic()
+            self.draw_lines(self.render(eventtime))
+            self.update_count += 1
+            self.update_time += reactor.monotonic() - start_time
             return eventtime + MENU_UPDATE_DELAY
-        elif not self.is_running() and self._autorun is True:
+        # The display redraws its own screen when the menu is not running
+        self.screen_lines = None
+        if self._autorun is True:
             # lets start and populate the menu items
             self.begin(eventtime)
             return eventtime + MENU_UPDATE_DELAY
-        else:
-            return 0
+        return 0
+
+    def stats(self, eventtime):
+        if not self.update_count:
+            return False, ""
+        return False, "menu: updates=%d redraws=%d time=%.3f" % (
+            self.update_count, self.redraw_count, self.update_time)
 
     def up(self, fast_rate=False):
         container = self.stack_peek()
@@ -4,7 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
-import icons, font8x14
+import icons, font8x14, framebuffer
 
 BACKGROUND_PRIORITY_CLOCK = 0x7fffffff00000000
 
@@ -34,17 +34,18 @@ class ST7920:
         self.send_data_cmd = self.send_cmds_cmd = None
         self.is_extended = False
         # framebuffers
-        self.text_framebuffer = bytearray(' '*64)
-        self.glyph_framebuffer = bytearray(128)
-        self.graphics_framebuffers = [bytearray(32) for i in range(32)]
+        Framebuffer = framebuffer.Framebuffer
+        self.text_framebuffer = Framebuffer(64, align=2)
+        self.glyph_framebuffer = Framebuffer(128, '\0', align=2)
+        self.graphics_framebuffers = [Framebuffer(32, '\0', align=2)
+                                      for i in range(32)]
         self.all_framebuffers = [
             # Text framebuffer
-            (self.text_framebuffer, bytearray('~'*64), 0x80),
+            (self.text_framebuffer, 0x80),
             # Glyph framebuffer
-            (self.glyph_framebuffer, bytearray('~'*128), 0x40),
+            (self.glyph_framebuffer, 0x40),
             # Graphics framebuffers
-            ] + [(self.graphics_framebuffers[i], bytearray('~'*32), i)
-                 for i in range(32)]
+            ] + [(self.graphics_framebuffers[i], i) for i in range(32)]
         self.cached_glyphs = {}
     def build_config(self):
         self.mcu.add_config_cmd(
@@ -71,33 +72,18 @@ class ST7920:
         cmd_type.send([self.oid, cmds], reqclock=BACKGROUND_PRIORITY_CLOCK)
         #logging.debug("st7920 %d %s", is_data, repr(cmds))
     def flush(self):
-        # Find all differences in the framebuffers and send them to the chip
-        for new_data, old_data, fb_id in self.all_framebuffers:
-            if new_data == old_data:
-                continue
-            # Find the position of all changed bytes in this framebuffer
-            diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
-                     if n != o]
-            # Batch together changes that are close to each other
-            for i in range(len(diffs)-2, -1, -1):
-                pos, count = diffs[i]
-                nextpos, nextcount = diffs[i+1]
-                if pos + 5 >= nextpos and nextcount < 16:
-                    diffs[i][1] = nextcount + (nextpos - pos)
-                    del diffs[i+1]
-            # Transmit changes
-            for pos, count in diffs:
-                count += pos & 0x01
-                count += count & 0x01
-                pos = pos & ~0x01
+        # Send all changed regions of the framebuffers to the chip
+        for fb, fb_id in self.all_framebuffers:
+            for pos, count in fb.get_updates():
                 chip_pos = pos >> 1
                 if fb_id < 0x40:
                     # Graphics framebuffer update
                     self.send([0x80 + fb_id, 0x80 + chip_pos], is_extended=True)
                 else:
                     self.send([fb_id + chip_pos])
-                self.send(new_data[pos:pos+count], is_data=True)
-            old_data[:] = new_data
+                self.send(fb.data[pos:pos+count], is_data=True)
+    def get_framebuffers(self):
+        return [fb for fb, fb_id in self.all_framebuffers]
     def init(self):
         cmds = [0x24, # Enter extended mode
                 0x40, # Clear vertical scroll address
@@ -119,14 +105,14 @@ class ST7920:
             pos = glyph_id*32 + i*2
             b1, b2 = (bits >> 8) & 0xff, bits & 0xff
             b1, b2 = b1 ^ (base_bits >> 8) & 0xff, b2 ^ base_bits & 0xff
-            self.glyph_framebuffer[pos:pos+2] = [b1, b2]
-            self.all_framebuffers[1][1][pos:pos+2] = [b1 ^ 1, b2 ^ 1]
+            self.glyph_framebuffer.write(pos, [b1, b2])
+            self.glyph_framebuffer.invalidate(pos, pos+2)
         self.cached_glyphs[glyph_name] = (base_glyph_name, (0, glyph_id*2))
     def write_text(self, x, y, data):
         if x + len(data) > 16:
             data = data[:16 - min(x, 16)]
         pos = [0, 32, 16, 48][y] + x
-        self.text_framebuffer[pos:pos+len(data)] = data
+        self.text_framebuffer.write(pos, data)
     def write_graphics(self, x, y, row, data):
         if x + len(data) > 16:
             data = data[:16 - min(x, 16)]
@@ -134,7 +120,7 @@ class ST7920:
         if gfx_fb >= 32:
             gfx_fb -= 32
             x += 16
-        self.graphics_framebuffers[gfx_fb][x:x+len(data)] = data
+        self.graphics_framebuffers[gfx_fb].write(x, data)
     def write_glyph(self, x, y, glyph_name):
         glyph_id = self.cached_glyphs.get(glyph_name)
         if glyph_id is not None and x & 1 == 0:
@@ -160,9 +146,8 @@ class ST7920:
             return 1
         return 0
     def clear(self):
-        self.text_framebuffer[:] = ' '*64
-        zeros = bytearray(32)
+        self.text_framebuffer.clear()
         for gfb in self.graphics_framebuffers:
-            gfb[:] = zeros
+            gfb.clear()
     def get_dimensions(self):
         return (16, 4)
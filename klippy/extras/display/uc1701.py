@@ -5,7 +5,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
-import icons, font8x14, extras.bus
+import icons, font8x14, framebuffer, extras.bus
 
 BACKGROUND_PRIORITY_CLOCK = 0x7fffffff00000000
 
@@ -15,9 +15,7 @@ class DisplayBase:
     def __init__(self, io):
         self.send = io.send
         # framebuffers
-        self.vram = [bytearray(128) for i in range(8)]
-        self.all_framebuffers = [(self.vram[i], bytearray('~'*128), i)
-                                 for i in range(8)]
+        self.vram = [framebuffer.Framebuffer(128, '\0') for i in range(8)]
         # Cache fonts and icons in display byte order
         self.font = [self._swizzle_bits(bytearray(c))
                      for c in font8x14.VGA_FONT]
@@ -27,30 +25,18 @@ class DisplayBase:
             top2, bot2 = self._swizzle_bits(icon)
             self.icons[name] = (top1 + top2, bot1 + bot2)
     def flush(self):
-        # Find all differences in the framebuffers and send them to the chip
-        for new_data, old_data, page in self.all_framebuffers:
-            if new_data == old_data:
-                continue
-            # Find the position of all changed bytes in this framebuffer
-            diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
-                     if n != o]
-            # Batch together changes that are close to each other
-            for i in range(len(diffs)-2, -1, -1):
-                pos, count = diffs[i]
-                nextpos, nextcount = diffs[i+1]
-                if pos + 5 >= nextpos and nextcount < 16:
-                    diffs[i][1] = nextcount + (nextpos - pos)
-                    del diffs[i+1]
-            # Transmit changes
-            for col_pos, count in diffs:
+        # Send all changed regions of the framebuffers to the chip
+        for page, fb in enumerate(self.vram):
+            for col_pos, count in fb.get_updates():
                 # Set Position registers
                 ra = 0xb0 | (page & 0x0F)
                 ca_msb = 0x10 | ((col_pos >> 4) & 0x0F)
                 ca_lsb = col_pos & 0x0F
                 self.send([ra, ca_msb, ca_lsb])
                 # Send Data
-                self.send(new_data[col_pos:col_pos+count], is_data=True)
-            old_data[:] = new_data
+                self.send(fb.data[col_pos:col_pos+count], is_data=True)
+    def get_framebuffers(self):
+        return self.vram
     def _swizzle_bits(self, data):
         # Convert 8x16 data into display col/row order
         bits_top = [0] * 8
@@ -63,33 +49,38 @@ class DisplayBase:
     def write_text(self, x, y, data):
         if x + len(data) > 16:
             data = data[:16 - min(x, 16)]
-        pix_x = x * 8
-        page_top = self.vram[y * 2]
-        page_bot = self.vram[y * 2 + 1]
+        pix_x = start_x = x * 8
+        fb_top = self.vram[y * 2]
+        fb_bot = self.vram[y * 2 + 1]
+        page_top, page_bot = fb_top.data, fb_bot.data
         for c in data:
             bits_top, bits_bot = self.font[ord(c)]
             page_top[pix_x:pix_x+8] = bits_top
             page_bot[pix_x:pix_x+8] = bits_bot
             pix_x += 8
+        fb_top.mark_dirty(start_x, pix_x)
+        fb_bot.mark_dirty(start_x, pix_x)
     def write_graphics(self, x, y, row, data):
         if x + len(data) > 16:
             data = data[:16 - min(x, 16)]
-        page = self.vram[y * 2 + (row >= 8)]
+        fb = self.vram[y * 2 + (row >= 8)]
+        page = fb.data
         bit = 1 << (row % 8)
-        pix_x = x * 8
+        pix_x = start_x = x * 8
         for bits in data:
             for col in range(8):
                 if (bits << col) & 0x80:
                     page[pix_x] ^= bit
                 pix_x += 1
+        fb.mark_dirty(start_x, pix_x)
     def write_glyph(self, x, y, glyph_name):
         icon = self.icons.get(glyph_name)
         if icon is not None and x < 15:
             # Draw icon in graphics mode
             pix_x = x * 8
             page_idx = y * 2
-            self.vram[page_idx][pix_x:pix_x+16] = icon[0]
-            self.vram[page_idx + 1][pix_x:pix_x+16] = icon[1]
+            self.vram[page_idx].write(pix_x, icon[0])
+            self.vram[page_idx + 1].write(pix_x, icon[1])
             return 2
         char = TextGlyphs.get(glyph_name)
         if char is not None:
@@ -98,9 +89,8 @@ class DisplayBase:
             return 1
         return 0
     def clear(self):
-        zeros = bytearray(128)
         for page in self.vram:
-            page[:] = zeros
+            page.clear()
     def get_dimensions(self):
         return (16, 4)
 
@@ -13,26 +13,29 @@ import jinja2
 
 # Wrapper for "status" access to printer object get_status() methods
 class StatusWrapper:
-    def __init__(self, printer, eventtime=None):
+    def __init__(self, printer, snapshot, eventtime=None):
         self.printer = printer
+        self.snapshot = snapshot
         self.eventtime = eventtime
         self.cache = {}
     def __getitem__(self, val):
         sval = str(val).strip()
         if sval in self.cache:
             return self.cache[sval]
-        po = self.printer.lookup_object(sval, None)
-        if po is None or not hasattr(po, 'get_status'):
-            raise KeyError(val)
         if self.eventtime is None:
             self.eventtime = self.printer.get_reactor().monotonic()
-        self.cache[sval] = res = dict(po.get_status(self.eventtime))
+        res = self.snapshot.lookup_status('gcode_macro', sval, self.eventtime,
+                                          self.snapshot.macro_interval)
+        if res is None:
+            raise KeyError(val)
+        self.cache[sval] = res = dict(res)
         return res
 
 # Wrapper around a Jinja2 template
 class TemplateWrapper:
     def __init__(self, printer, env, name, script):
         self.printer = printer
+        self.snapshot = printer.lookup_object('status_snapshot')
         self.name = name
         self.gcode = self.printer.lookup_object('gcode')
         try:
@@ -42,11 +45,17 @@ class TemplateWrapper:
                  name, traceback.format_exception_only(type(e), e)[-1])
             logging.exception(msg)
             raise printer.config_error(msg)
+        # Statistics
+        self.render_count = 0
+        self.render_time = 0.
     def create_status_wrapper(self, eventtime=None):
-        return StatusWrapper(self.printer, eventtime)
+        return StatusWrapper(self.printer, self.snapshot, eventtime)
     def render(self, context=None):
         if context is None:
             context = {'status': self.create_status_wrapper()}
+        reactor = self.printer.get_reactor()
+        start_time = reactor.monotonic()
+        self.render_count += 1
         try:
             return str(self.template.render(context))
         except Exception as e:
@@ -54,6 +63,8 @@ class TemplateWrapper:
                 self.name, traceback.format_exception_only(type(e), e)[-1])
             logging.exception(msg)
             raise self.gcode.error(msg)
+        finally:
+            self.render_time += reactor.monotonic() - start_time
     def run_gcode_from_command(self, context=None):
         self.gcode.run_script_from_command(self.render(context))
 
@@ -61,11 +72,35 @@ class TemplateWrapper:
 class PrinterGCodeMacro:
     def __init__(self, config):
         self.printer = config.get_printer()
+        self.printer.try_load_module(config, 'status_snapshot')
         self.env = jinja2.Environment('{%', '%}', '{', '}')
+        self.templates = []
+        gcode = self.printer.lookup_object('gcode')
+        gcode.register_command("GCODE_MACRO_STATS", self.cmd_GCODE_MACRO_STATS,
+                               desc=self.cmd_GCODE_MACRO_STATS_help)
     def load_template(self, config, option):
         name = "%s:%s" % (config.get_name(), option)
         script = config.get(option, '')
-        return TemplateWrapper(self.printer, self.env, name, script)
+        template = TemplateWrapper(self.printer, self.env, name, script)
+        self.templates.append(template)
+        return template
+    def stats(self, eventtime):
+        used = [t for t in self.templates if t.render_count]
+        if not used:
+            return False, ""
+        return False, "gcode_macro: renders=%d render_time=%.3f" % (
+            sum([t.render_count for t in used]),
+            sum([t.render_time for t in used]))
+    cmd_GCODE_MACRO_STATS_help = "Report template render statistics"
+    def cmd_GCODE_MACRO_STATS(self, params):
+        used = [t for t in self.templates if t.render_count]
+        if not used:
+            msg = "No templates rendered"
+        else:
+            msg = "\n".join(["%s: renders=%d render_time=%.6f" % (
+                t.name, t.render_count, t.render_time)
+                              for t in used])
+        self.printer.lookup_object('gcode').respond_info(msg)
 
 def load_config(config):
     return PrinterGCodeMacro(config)
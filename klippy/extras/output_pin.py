@@ -39,20 +39,26 @@ class PrinterOutputPin:
             self.gcode.register_mux_command("SET_PIN", "PIN", pin_name,
                                             self.cmd_SET_PIN,
                                             desc=self.cmd_SET_PIN_help)
+        # Most recently requested value (applied when queued moves flush)
+        self.req_value = self.last_value
     cmd_SET_PIN_help = "Set the value of an output pin"
     def cmd_SET_PIN(self, params):
         value = self.gcode.get_float('VALUE', params,
                                      minval=0., maxval=self.scale)
         value /= self.scale
-        if value == self.last_value:
+        if value == self.req_value:
             return
-        print_time = self.printer.lookup_object('toolhead').get_last_move_time()
+        if not self.is_pwm and value not in [0., 1.]:
+            raise self.gcode.error("Invalid pin value")
+        self.req_value = value
+        toolhead = self.printer.lookup_object('toolhead')
+        toolhead.register_lookahead_callback(
+            (lambda print_time: self._set_pin(print_time, value)))
+    def _set_pin(self, print_time, value):
         print_time = max(print_time, self.last_value_time + PIN_MIN_TIME)
         if self.is_pwm:
             self.mcu_pin.set_pwm(print_time, value)
         else:
-            if value not in [0., 1.]:
-                raise self.gcode.error("Invalid pin value")
             self.mcu_pin.set_digital(print_time, value)
         self.last_value = value
         self.last_value_time = print_time
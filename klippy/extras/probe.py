@@ -3,7 +3,8 @@
 # Copyright (C) 2017-2019  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import pins, homing, manual_probe
+import logging, math
+import pins, homing, manual_probe, mathutil
 
 HINT_TIMEOUT = """
 Make sure to home the printer before probing. If the probe
@@ -22,6 +23,7 @@ class PrinterProbe:
         self.y_offset = config.getfloat('y_offset', 0.)
         self.z_offset = config.getfloat('z_offset')
         self.probe_calibrate_z = 0.
+        self.multi_probe_pending = False
         # Infer Z position to move to during a probe
         if config.has_section('stepper_z'):
             zconfig = config.getsection('stepper_z')
@@ -49,10 +51,21 @@ class PrinterProbe:
         return self.mcu_probe
     def get_offsets(self):
         return self.x_offset, self.y_offset, self.z_offset
+    def multi_probe_begin(self):
+        # Keep the probe deployed across multiple run_probe() calls
+        self.mcu_probe.multi_probe_begin()
+        self.multi_probe_pending = True
+    def multi_probe_end(self):
+        if self.multi_probe_pending:
+            self.multi_probe_pending = False
+            try:
+                self.mcu_probe.multi_probe_end()
+            except homing.EndstopError as e:
+                raise self.gcode.error(str(e))
     cmd_PROBE_help = "Probe Z-height at current XY position"
     def cmd_PROBE(self, params):
-        self._probe(self.speed)
-    def _probe(self, speed):
+        self.run_probe(self.speed)
+    def run_probe(self, speed):
         toolhead = self.printer.lookup_object('toolhead')
         homing_state = homing.Homing(self.printer)
         pos = toolhead.get_position()
@@ -71,6 +84,7 @@ class PrinterProbe:
         self.gcode.respond_info("probe at %.3f,%.3f is z=%.6f" % (
             pos[0], pos[1], pos[2]))
         self.gcode.reset_last_position()
+        return pos
     cmd_QUERY_PROBE_help = "Return the status of the z-probe"
     def cmd_QUERY_PROBE(self, params):
         toolhead = self.printer.lookup_object('toolhead')
@@ -100,16 +114,19 @@ class PrinterProbe:
                                 z_start_position, number_of_reads, speed))
         # Probe bed "number_of_reads" times
         sum_reads = 0
-        for i in range(number_of_reads):
-            # Move Z to start reading position
-            self._move(start_pos, speed)
-            # Probe
-            self._probe(speed)
-            # Get Z value, accumulate value to calculate average
-            # and save it to calculate standard deviation
-            pos = toolhead.get_position()
-            sum_reads += pos[2]
-            probes.append(pos[2])
+        self.multi_probe_begin()
+        try:
+            for i in range(number_of_reads):
+                # Move Z to start reading position
+                self._move(start_pos, speed)
+                # Probe
+                pos = self.run_probe(speed)
+                # Accumulate value to calculate average and save it
+                # to calculate standard deviation
+                sum_reads += pos[2]
+                probes.append(pos[2])
+        finally:
+            self.multi_probe_end()
         # Move Z to start reading position
         self._move(start_pos, speed)
         # Calculate maximum, minimum and average values
@@ -158,7 +175,7 @@ class PrinterProbe:
     cmd_PROBE_CALIBRATE_help = "Calibrate the probe's z_offset"
     def cmd_PROBE_CALIBRATE(self, params):
         # Perform initial probe
-        self._probe(self.speed)
+        self.run_probe(self.speed)
         # Move away from the bed
         toolhead = self.printer.lookup_object('toolhead')
         curpos = toolhead.get_position()
@@ -184,6 +201,7 @@ class ProbeEndstopWrapper:
             config, 'activate_gcode')
         self.deactivate_gcode = gcode_macro.load_template(
             config, 'deactivate_gcode')
+        self.multi = self.activated = False
         # Create an "endstop" object to handle the probe pin
         ppins = self.printer.lookup_object('pins')
         pin = config.get('pin')
@@ -204,21 +222,127 @@ class ProbeEndstopWrapper:
         kin = self.printer.lookup_object('toolhead').get_kinematics()
         for stepper in kin.get_steppers('Z'):
             stepper.add_to_endstop(self)
-    def home_prepare(self):
+    def _activate(self):
         try:
             self.activate_gcode.run_gcode_from_command()
         except self.gcode.error as e:
             raise homing.EndstopError(str(e))
-        self.mcu_endstop.home_prepare()
-    def home_finalize(self):
+        self.activated = True
+    def _deactivate(self):
+        self.activated = False
         try:
             self.deactivate_gcode.run_gcode_from_command()
         except self.gcode.error as e:
             raise homing.EndstopError(str(e))
+    def multi_probe_begin(self):
+        self.multi = True
+    def multi_probe_end(self):
+        self.multi = False
+        if self.activated:
+            self._deactivate()
+    def home_prepare(self):
+        if not self.activated:
+            self._activate()
+        self.mcu_endstop.home_prepare()
+    def home_finalize(self):
+        if not self.multi:
+            self._deactivate()
         self.mcu_endstop.home_finalize()
     def get_position_endstop(self):
         return self.position_endstop
 
+# Return the XY travel distance when visiting 'points' (in the given
+# 'order') starting from 'start_pos'
+def calc_travel_distance(start_pos, points, order):
+    dist = 0.
+    prev_x, prev_y = start_pos[:2]
+    for i in order:
+        x, y = points[i]
+        dist += math.sqrt((x - prev_x)**2 + (y - prev_y)**2)
+        prev_x, prev_y = x, y
+    return dist
+
+# Find a short order in which to visit 'points' starting from
+# 'start_pos' (nearest neighbor tour improved with 2-opt).  If
+# 'start_pos' is None the path may start at any point.  Returns a list
+# of indexes into 'points'.
+def optimize_point_order(start_pos, points, max_passes=20):
+    coords = [tuple(p) for p in points]
+    dists = [[0.] * (len(coords) + 1)]
+    for x1, y1 in coords:
+        dists.append([0.] + [math.sqrt((x1 - x2)**2 + (y1 - y2)**2)
+                             for x2, y2 in coords])
+    if start_pos is not None:
+        dists[0] = [0.] + [math.sqrt((start_pos[0] - x)**2
+                                     + (start_pos[1] - y)**2)
+                           for x, y in coords]
+        for i in range(1, len(dists)):
+            dists[i][0] = dists[0][i]
+    count = len(dists)
+    # Build initial path using nearest neighbor
+    path = [0]
+    remaining = set(range(1, count))
+    while remaining:
+        row = dists[path[-1]]
+        nearest = min(remaining, key=(lambda i: (row[i], i)))
+        remaining.remove(nearest)
+        path.append(nearest)
+    # Improve path with 2-opt (the start position is fixed and the
+    # path end is free)
+    for p in range(max_passes):
+        improved = False
+        for i in range(1, count - 1):
+            prev_dists = dists[path[i-1]]
+            cur_dist = prev_dists[path[i]]
+            for j in range(i + 1, count):
+                delta = prev_dists[path[j]] - cur_dist
+                if j + 1 < count:
+                    next_i = path[j+1]
+                    delta += (dists[path[i]][next_i]
+                              - dists[path[j]][next_i])
+                if delta < -0.000001:
+                    path[i:j+1] = path[i:j+1][::-1]
+                    cur_dist = prev_dists[path[i]]
+                    improved = True
+        if not improved:
+            break
+    return [i - 1 for i in path[1:]]
+
+# Helper to repeat a probe sequence until the probed points are level
+class RetryHelper:
+    def __init__(self, config, error_msg_extra=""):
+        self.gcode = config.get_printer().lookup_object('gcode')
+        self.max_retries = config.getint("retries", 0, minval=0)
+        self.retry_tolerance = config.getfloat(
+            "retry_tolerance", 0., minval=0.)
+        self.error_msg_extra = error_msg_extra
+        self.current_retry = 0
+        self.previous = None
+    def start(self):
+        self.current_retry = 0
+        self.previous = None
+    def check_retry(self, positions):
+        if not self.max_retries:
+            return "done"
+        # Residual rms of the probed points from a level plane
+        z_avg = sum([p[2] for p in positions]) / len(positions)
+        residuals, rms = mathutil.plane_residuals(positions, 0., 0., z_avg)
+        self.gcode.respond_info(
+            "Retries: %d/%d Probed points rms: %.6f tolerance: %.6f" % (
+                self.current_retry, self.max_retries, rms,
+                self.retry_tolerance))
+        if rms <= self.retry_tolerance:
+            return "done"
+        if self.previous is not None and rms > self.previous + 0.0000001:
+            raise self.gcode.error(
+                "Retries aborting: probed points rms is increasing. %s" % (
+                    self.error_msg_extra,))
+        self.previous = rms
+        self.current_retry += 1
+        if self.current_retry > self.max_retries:
+            raise self.gcode.error("Too many retries")
+        return "retry"
+
 # Helper code that can probe a series of points and report the
 # position at each point.
 class ProbePointsHelper:
@@ -248,10 +372,19 @@ class ProbePointsHelper:
         self.samples_result = config.getchoice('samples_result',
                                                {'median': 0, 'average': 1},
                                                default='average')
+        self.optimize_order = config.getboolean('optimize_probe_order', False)
+        self.optimized_order = None
+        if self.optimize_order:
+            # The path only depends on the points - find it once
+            self.optimized_order = optimize_point_order(
+                None, self.probe_points)
         # Internal probing state
         self.results = []
+        self.point_times = []
+        self.probe_order = list(range(len(self.probe_points)))
+        self.travel_saved = 0.
         self.busy = self.manual_probe = False
-        self.gcode = self.toolhead = None
+        self.gcode = self.toolhead = self.probe = None
     def get_lift_speed(self):
         return self.lift_speed
     def _lift_z(self, z_pos, add=False, speed=None):
@@ -277,7 +410,7 @@ class ProbePointsHelper:
             self._finalize(True)
             return
         # Move to next XY probe point
-        x, y = self.probe_points[len(self.results)]
+        x, y = self.probe_points[self.probe_order[len(self.results)]]
         curpos = self.toolhead.get_position()
         curpos[0] = x
         curpos[1] = y
@@ -292,14 +425,16 @@ class ProbePointsHelper:
             manual_probe.ManualProbeHelper(self.printer, {},
                                            self._manual_probe_finalize)
     def _automatic_probe_point(self):
+        reactor = self.printer.get_reactor()
+        start_time = reactor.monotonic()
         positions = []
         for i in range(self.samples):
             try:
-                self.gcode.run_script_from_command("PROBE")
+                pos = self.probe.run_probe(self.probe.speed)
             except self.gcode.error as e:
                 self._finalize(False)
                 raise
-            positions.append(self.toolhead.get_position())
+            positions.append(pos)
             if i < self.samples - 1:
                 # retract
                 self._lift_z(self.sample_retract_dist, add=True)
@@ -323,6 +458,31 @@ class ProbePointsHelper:
                                 positions[0][1],
                                 median]
         self.results.append(calculated_value)
+        self.point_times.append(reactor.monotonic() - start_time)
+    def _setup_probe_order(self):
+        self.probe_order = list(range(len(self.probe_points)))
+        self.travel_saved = 0.
+        if self.optimized_order is None:
+            return
+        start_pos = self.toolhead.get_position()
+        points = self.probe_points
+        order = self.optimized_order
+        if (calc_travel_distance(start_pos, points, order[-1:])
+            < calc_travel_distance(start_pos, points, order[:1])):
+            order = order[::-1]
+        orig_dist = calc_travel_distance(start_pos, points, self.probe_order)
+        new_dist = calc_travel_distance(start_pos, points, order)
+        if new_dist >= orig_dist:
+            return
+        self.probe_order = order
+        # Travel to the first point depends on where the toolhead was,
+        # so it is not included in the reported savings
+        orig_dist -= calc_travel_distance(start_pos, points, [0])
+        new_dist -= calc_travel_distance(start_pos, points, order[:1])
+        self.travel_saved = (orig_dist - new_dist) / self.speed
+        logging.info("Optimized probe order: travel %.3fmm (was %.3fmm)"
+                     " estimated time saved %.3fs",
+                     new_dist, orig_dist, self.travel_saved)
     def start_probe(self, params):
         # Lookup objects
         self.toolhead = self.printer.lookup_object('toolhead')
@@ -331,6 +491,7 @@ class ProbePointsHelper:
         method = self.gcode.get_str('METHOD', params, 'automatic').lower()
         if probe is not None and method == 'automatic':
             self.manual_probe = False
+            self.probe = probe
             self.lift_speed = min(self.speed, probe.speed)
             self.probe_offsets = probe.get_offsets()
             if self.horizontal_move_z < self.probe_offsets[2]:
@@ -338,18 +499,26 @@ class ProbePointsHelper:
                                        " probe's z_offset")
         else:
             self.manual_probe = True
+            self.probe = None
             self.lift_speed = self.speed
             self.probe_offsets = (0., 0., 0.)
         # Start probe
         self.results = []
+        self.point_times = []
         self.busy = True
         self._lift_z(self.horizontal_move_z, speed=self.speed)
+        self._setup_probe_order()
         self._move_next()
         if not self.manual_probe:
-            # Perform automatic probing
-            while self.busy:
-                self._automatic_probe_point()
-                self._move_next()
+            # Perform automatic probing (keeping the probe deployed
+            # across all samples and points)
+            self.probe.multi_probe_begin()
+            try:
+                while self.busy:
+                    self._automatic_probe_point()
+                    self._move_next()
+            finally:
+                self.probe.multi_probe_end()
     def _manual_probe_finalize(self, kin_pos):
         if kin_pos is None:
             self._finalize(False)
@@ -359,8 +528,32 @@ class ProbePointsHelper:
     def _finalize(self, success):
         self.busy = False
         self.gcode.reset_last_position()
-        if success:
-            self.finalize_callback(self.probe_offsets, self.results)
+        if self.probe is not None:
+            self.probe.multi_probe_end()
+        if not success:
+            return
+        if self.point_times:
+            logging.info("Probed %d points in %.3fs (per point: %s)",
+                         len(self.point_times), sum(self.point_times),
+                         " ".join(["%.3f" % (t,) for t in self.point_times]))
+        if self.travel_saved:
+            self.gcode.respond_info(
+                "Optimized probe order: estimated travel time saved %.3fs" % (
+                    self.travel_saved,))
+        # Report the results in the originally configured point order
+        results = [None] * len(self.results)
+        for i, res in zip(self.probe_order, self.results):
+            results[i] = res
+        res = self.finalize_callback(self.probe_offsets, results)
+        if res == "retry":
+            # Probe all the points again
+            self.results = []
+            self.point_times = []
+            self.busy = True
+            if self.probe is not None:
+                self.probe.multi_probe_begin()
+            self._setup_probe_order()
+            self._move_next()
 
 def load_config(config):
     return PrinterProbe(config, ProbeEndstopWrapper(config))
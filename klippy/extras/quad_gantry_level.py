@@ -4,7 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
-import probe
+import probe, mathutil
 
 class QuadGantryLevel:
     def __init__(self, config):
@@ -13,6 +13,8 @@ class QuadGantryLevel:
         self.printer.register_event_handler("klippy:connect",
                                             self.handle_connect)
         self.probe_helper = probe.ProbePointsHelper(config, self.probe_finalize)
+        self.retry_helper = probe.RetryHelper(
+            config, "Possibly Z motor numbering is wrong")
         gantry_corners = config.get('gantry_corners').split('\n')
         try:
             gantry_corners = [line.split(',', 1)
@@ -41,6 +43,7 @@ class QuadGantryLevel:
     cmd_QUAD_GANTRY_LEVEL_help = (
         "Conform a moving, twistable gantry to the shape of a stationary bed")
     def cmd_QUAD_GANTRY_LEVEL(self, params):
+        self.retry_helper.start()
         self.probe_helper.start_probe(params)
     def probe_finalize(self, offsets, positions):
         # Mirror our perspective so the adjustments make sense
@@ -50,6 +53,18 @@ class QuadGantryLevel:
             "\n".join(["z%s = %.6f" % (z_id, z_positions[z_id])
                 for z_id in range(len(z_positions))]))
         self.gcode.respond_info(points_message)
+        # Report how far the probed points are from a flat plane
+        plane_points = [(p[0] + offsets[0], p[1] + offsets[1], z)
+                        for p, z in zip(positions, z_positions)]
+        try:
+            fit = mathutil.plane_fit(plane_points)
+        except ZeroDivisionError:
+            raise self.gcode.error(
+                "Unable to calculate gantry plane - points are collinear")
+        residuals, rms = mathutil.plane_residuals(plane_points, *fit)
+        self.gcode.respond_info("Plane fit residuals:\n%s\nrms: %.6f" % (
+            "\n".join(["z%d = %.6f" % (z_id, r)
+                       for z_id, r in enumerate(residuals)]), rms))
         p1 = [positions[0][0] + offsets[0],z_positions[0]]
         p2 = [positions[1][0] + offsets[0],z_positions[1]]
         p3 = [positions[2][0] + offsets[0],z_positions[2]]
@@ -88,6 +103,7 @@ class QuadGantryLevel:
             for s in self.z_steppers:
                 s.set_ignore_move(False)
             raise
+        return self.retry_helper.check_retry(plane_points)
     def linefit(self,p1,p2):
         if p1[1] == p2[1]:
             # Straight line
@@ -49,17 +49,19 @@ class PrinterServo:
         if self.initial_pwm_value is not None:
             toolhead = self.printer.lookup_object('toolhead')
             print_time = toolhead.get_last_move_time()
-            self._set_pwm(print_time, self.initial_pwm_value)
-    def _set_pwm(self, print_time, value):
-        if value == self.last_value and self.enable == self.last_enable:
+            self._set_pwm(print_time, self.initial_pwm_value, self.enable)
+    def _set_pwm(self, print_time, value, enable):
+        if value is None:
+            value = self.last_value
+        if value == self.last_value and enable == self.last_enable:
             return
         print_time = max(print_time, self.last_value_time + PIN_MIN_TIME)
-        if self.enable:
+        if enable:
           self.mcu_servo.set_pwm(print_time, value)
         else:
           self.mcu_servo.set_pwm(print_time, 0)
         self.last_value = value
-        self.last_enable = self.enable
+        self.last_enable = enable
         self.last_value_time = print_time
     def _get_pwm_from_angle(self, angle):
         angle = max(0., min(self.max_angle, angle))
@@ -70,19 +72,20 @@ class PrinterServo:
         return width * self.width_to_value
     cmd_SET_SERVO_help = "Set servo angle"
     def cmd_SET_SERVO(self, params):
-        print_time = self.printer.lookup_object('toolhead').get_last_move_time()
         if 'ENABLE' in params:
             value = self.gcode.get_int('ENABLE', params)
             self.enable = value != 0
+        enable = self.enable
+        value = None
         if 'WIDTH' in params:
-            self._set_pwm(print_time, self._get_pwm_from_pulse_width(
-                self.gcode.get_float('WIDTH', params)))
-        else:
-            if 'ANGLE' in params:
-                self._set_pwm(print_time, self._get_pwm_from_angle(
-                    self.gcode.get_float('ANGLE', params)))
-            else:
-                self._set_pwm(print_time, self.last_value)
+            value = self._get_pwm_from_pulse_width(
+                self.gcode.get_float('WIDTH', params))
+        elif 'ANGLE' in params:
+            value = self._get_pwm_from_angle(
+                self.gcode.get_float('ANGLE', params))
+        toolhead = self.printer.lookup_object('toolhead')
+        toolhead.register_lookahead_callback(
+            (lambda print_time: self._set_pwm(print_time, value, enable)))
 
 def load_config_prefix(config):
     return PrinterServo(config)
@@ -5,24 +5,54 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
 
+# Add the fields of an object's stats message to a record.  Fields
+# following a "name:" prefix are stored in a sub-record of that name.
+def parse_stats(msg, record):
+    group = record
+    for part in msg.split():
+        if '=' not in part:
+            group = record.setdefault(part.rstrip(':'), {})
+            continue
+        name, val = part.split('=', 1)
+        try:
+            val = int(val)
+        except ValueError:
+            try:
+                val = float(val)
+            except ValueError:
+                pass
+        group[name] = val
+
 class PrinterStats:
     def __init__(self, config):
         self.printer = config.get_printer()
         reactor = self.printer.get_reactor()
         self.stats_timer = reactor.register_timer(self.generate_stats)
         self.stats_cb = []
+        self.want_record = not not self.printer.get_start_args().get(
+            'stats_file')
         self.printer.register_event_handler("klippy:ready", self.handle_ready)
     def handle_ready(self):
         self.stats_cb = [o.stats for n, o in self.printer.lookup_objects()
                          if hasattr(o, 'stats')]
+        bglogger = self.printer.get_bglogger()
+        if bglogger is not None:
+            self.stats_cb.append(bglogger.stats)
         if self.printer.get_start_args().get('debugoutput') is None:
             reactor = self.printer.get_reactor()
             reactor.update_timer(self.stats_timer, reactor.NOW)
     def generate_stats(self, eventtime):
         stats = [cb(eventtime) for cb in self.stats_cb]
         if max([s[0] for s in stats]):
-            logging.info("Stats %.1f: %s", eventtime,
-                         ' '.join([s[1] for s in stats]))
+            msg = ' '.join([s[1] for s in stats if s[1]])
+            extra = None
+            if self.want_record:
+                # Passed to the background logger's structured stats file
+                record = {'#sampletime': eventtime}
+                for s in stats:
+                    parse_stats(s[1], record)
+                extra = {'stats': record}
+            logging.info("Stats %.1f: %s", eventtime, msg, extra=extra)
         return eventtime + 1.
 
 def load_config(config):
@@ -0,0 +1,54 @@
+# Shared cache of printer object get_status() results
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import logging
+
+class StatusSnapshot:
+    def __init__(self, config):
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+        self.interval = config.getfloat('interval', .250, minval=0.)
+        self.macro_interval = config.getfloat(
+            'macro_interval', 0., minval=0.)
+        # Cached status (indexed by object)
+        self.entries = {}
+        # Object names read by each consumer
+        self.consumers = {}
+        # Statistics
+        self.request_count = self.build_count = 0
+        self.build_time = 0.
+    def get_status(self, consumer, name, obj, eventtime, max_age=None):
+        # Return obj.get_status(), reusing a result that is less than
+        # max_age seconds old.  The returned dict must not be modified.
+        if max_age is None:
+            max_age = self.interval
+        self.request_count += 1
+        names = self.consumers.setdefault(consumer, set())
+        if name not in names:
+            names.add(name)
+            logging.debug("Status consumer %s reads %s", consumer, name)
+        entry = self.entries.get(obj)
+        if entry is not None:
+            build_eventtime, status = entry
+            if (eventtime == build_eventtime
+                or build_eventtime <= eventtime < build_eventtime + max_age):
+                return status
+        start_time = self.reactor.monotonic()
+        status = obj.get_status(eventtime)
+        self.build_time += self.reactor.monotonic() - start_time
+        self.build_count += 1
+        self.entries[obj] = (eventtime, status)
+        return status
+    def lookup_status(self, consumer, name, eventtime, max_age=None):
+        obj = self.printer.lookup_object(name, None)
+        if obj is None or not hasattr(obj, 'get_status'):
+            return None
+        return self.get_status(consumer, name, obj, eventtime, max_age)
+    def stats(self, eventtime):
+        if not self.request_count:
+            return False, ""
+        return False, "status_snapshot: requests=%d builds=%d time=%.3f" % (
+            self.request_count, self.build_count, self.build_time)
+
+def load_config(config):
+    return StatusSnapshot(config)
@@ -4,7 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import math, logging, collections
-import bus
+import bus, serialhdl
 
 TMC_FREQUENCY=13200000.
 
@@ -211,6 +211,113 @@ def get_config_stealthchop(config, tmc_freq):
     return mres, True, max(0, min(0xfffff, threshold))
 
 
+######################################################################
+# Periodic driver status polling
+######################################################################
+
+MIN_POLL_INTERVAL = 0.100
+HealthFlags = ["otpw", "ot", "s2ga", "s2gb", "ola", "olb"]
+LoadFields = ["SG_RESULT", "SG@RDSEL1"]
+
+class error(Exception):
+    pass
+
+# Helper that periodically reads status registers in the background
+# and caches the decoded fields.  The read_func(reg_names) callback
+# must return a list of (reg_name, value) pairs and raise error or
+# serialhdl.error on a failed read.  Drivers without read_registers
+# only have a single status response - read_func() is then called
+# without arguments.
+class TMCStatusPoller:
+    def __init__(self, config, fields, read_func, read_registers=None,
+                 default_registers=("DRV_STATUS",)):
+        self.printer = config.get_printer()
+        self.name = config.get_name()
+        self.fields = fields
+        self.read_func = read_func
+        self.poll_interval = config.getfloat('poll_interval', 0., minval=0.)
+        if self.poll_interval and self.poll_interval < MIN_POLL_INTERVAL:
+            raise config.error("poll_interval must be at least %.3f" % (
+                MIN_POLL_INTERVAL,))
+        self.poll_registers = None
+        if read_registers is not None:
+            regs = config.get('poll_registers', ','.join(default_registers))
+            self.poll_registers = [r.strip() for r in regs.split(',')
+                                   if r.strip()]
+            for reg_name in self.poll_registers:
+                if reg_name not in read_registers:
+                    raise config.error("Unknown poll register '%s'" % (
+                        reg_name,))
+        # Cached status and trend statistics
+        self.status = {}
+        self.last_poll_time = 0.
+        self.poll_count = self.error_count = 0
+        self.flag_counts = {}
+        self.load_min = self.load_sum = None
+        self.poll_timer = None
+        if self.poll_interval:
+            self.printer.register_event_handler("klippy:ready",
+                                                self.handle_ready)
+            self.printer.register_event_handler("klippy:shutdown",
+                                                self.handle_shutdown)
+    def handle_shutdown(self):
+        if self.poll_timer is not None:
+            reactor = self.printer.get_reactor()
+            reactor.update_timer(self.poll_timer, reactor.NEVER)
+    def handle_ready(self):
+        if self.printer.get_start_args().get('debugoutput') is not None:
+            return
+        reactor = self.printer.get_reactor()
+        self.poll_timer = reactor.register_timer(self.poll_event, reactor.NOW)
+    def _update_trends(self, status):
+        for field_name, val in status.items():
+            if field_name.lower() in HealthFlags and val:
+                fname = field_name.lower()
+                self.flag_counts[fname] = self.flag_counts.get(fname, 0) + 1
+            elif field_name in LoadFields:
+                if self.load_min is None:
+                    self.load_min, self.load_sum = val, 0
+                self.load_min = min(self.load_min, val)
+                self.load_sum += val
+    def poll_event(self, eventtime):
+        try:
+            if self.poll_registers is None:
+                reg_vals = self.read_func()
+            else:
+                reg_vals = self.read_func(self.poll_registers)
+        except (serialhdl.error, error) as e:
+            if not self.error_count:
+                logging.info("%s: status poll failed: %s", self.name, str(e))
+            self.error_count += 1
+            return eventtime + self.poll_interval
+        status = {}
+        for reg_name, val in reg_vals:
+            for field_name in self.fields.all_fields.get(reg_name, {}):
+                status[field_name] = self.fields.get_field(
+                    field_name, val, reg_name)
+        self.status = status
+        self.last_poll_time = eventtime
+        self.poll_count += 1
+        self._update_trends(status)
+        return eventtime + self.poll_interval
+    def get_status(self, eventtime):
+        res = dict(self.status)
+        res['last_poll_time'] = self.last_poll_time
+        return res
+    def stats(self, eventtime):
+        if not self.poll_interval:
+            return False, ""
+        msg = "%s: polls=%d errors=%d" % (
+            self.name.replace(' ', '_'), self.poll_count, self.error_count)
+        for fname in HealthFlags:
+            if fname in self.flag_counts:
+                msg += " %s=%d" % (fname, self.flag_counts[fname])
+        if self.load_min is not None and self.poll_count:
+            msg += " load_min=%d load_avg=%.1f" % (
+                self.load_min, float(self.load_sum) / self.poll_count)
+        return False, msg
+
+
 ######################################################################
 # TMC2130 printer object
 ######################################################################
@@ -265,6 +372,9 @@ class TMC2130:
         sgt = config.getint('driver_SGT', 0, minval=-64, maxval=63) & 0x7f
         self.fields.set_field("sgt", sgt)
         self._init_registers()
+        # Optional background status polling
+        self.status_poller = TMCStatusPoller(
+            config, self.fields, self._read_status, ReadRegisters)
     def _init_registers(self, min_clock = 0):
         # Send registers
         for reg_name, val in self.regs.items():
@@ -275,12 +385,25 @@ class TMC2130:
         if pin_params['invert'] or pin_params['pullup']:
             raise pins.error("Can not pullup/invert tmc2130 virtual endstop")
         return TMC2130VirtualEndstop(self)
+    def get_registers(self, reg_names):
+        # Each spi transfer returns the register requested by the
+        # previous transfer, so issue all the reads in one batch
+        msgs = [[Registers[reg_name], 0x00, 0x00, 0x00, 0x00]
+                for reg_name in reg_names]
+        responses = self.spi.spi_transfer_batch(msgs + msgs[-1:])
+        vals = []
+        for params in responses[1:]:
+            pr = bytearray(params['response'])
+            vals.append((pr[1] << 24) | (pr[2] << 16) | (pr[3] << 8) | pr[4])
+        return vals
     def get_register(self, reg_name):
-        reg = Registers[reg_name]
-        self.spi.spi_send([reg, 0x00, 0x00, 0x00, 0x00])
-        params = self.spi.spi_transfer([reg, 0x00, 0x00, 0x00, 0x00])
-        pr = bytearray(params['response'])
-        return (pr[1] << 24) | (pr[2] << 16) | (pr[3] << 8) | pr[4]
+        return self.get_registers([reg_name])[0]
+    def _read_status(self, reg_names):
+        return zip(reg_names, self.get_registers(reg_names))
+    def get_status(self, eventtime):
+        return self.status_poller.get_status(eventtime)
+    def stats(self, eventtime):
+        return self.status_poller.stats(eventtime)
     def set_register(self, reg_name, val, min_clock = 0):
         reg = Registers[reg_name]
         data = [(reg | 0x80) & 0xff, (val >> 24) & 0xff, (val >> 16) & 0xff,
@@ -337,8 +460,8 @@ class TMC2130:
             if reg_name not in ReadRegisters:
                 gcode.respond_info(self.fields.pretty_format(reg_name, val))
         gcode.respond_info("========== Queried registers ==========")
-        for reg_name in ReadRegisters:
-            val = self.get_register(reg_name)
+        vals = self.get_registers(ReadRegisters)
+        for reg_name, val in zip(ReadRegisters, vals):
             gcode.respond_info(self.fields.pretty_format(reg_name, val))
     cmd_INIT_TMC_help = "Initialize TMC stepper driver registers"
     def cmd_INIT_TMC(self, params):
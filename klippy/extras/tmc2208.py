@@ -313,6 +313,10 @@ class TMC2208:
         set_config_field(config, "pwm_autograd", True)
         set_config_field(config, "PWM_REG", 8)
         set_config_field(config, "PWM_LIM", 12)
+        # Optional background status polling
+        self.uart_mutex = self.printer.get_reactor().mutex()
+        self.status_poller = tmc2130.TMCStatusPoller(
+            config, self.fields, self._read_status, ReadRegisters)
     def build_config(self):
         bit_ticks = int(self.mcu.get_adjusted_freq() / 9000.)
         self.mcu.add_config_cmd(
@@ -323,21 +327,54 @@ class TMC2208:
             "tmcuart_send oid=%c write=%*s read=%c", cq=cmd_queue)
     def _init_registers(self):
         # Send registers
-        for reg_name, val in self.regs.items():
-            self.set_register(reg_name, val)
+        reactor = self.printer.get_reactor()
+        start_time = reactor.monotonic()
+        try:
+            self.set_registers(self.regs.items())
+        except tmc2130.error as e:
+            raise self.printer.config_error(str(e))
+        logging.info("tmc2208 %s: initialized %d registers in %.3fs",
+                     self.name, len(self.regs),
+                     reactor.monotonic() - start_time)
+    def _send_uart(self, msg, read_len):
+        # Only one uart transfer may wait for a response at a time
+        with self.uart_mutex:
+            return self.tmcuart_send_cmd.send_with_response(
+                [self.oid, msg, read_len], 'tmcuart_response', self.oid)
     def get_register(self, reg_name):
         reg = Registers[reg_name]
         msg = encode_tmc2208_read(0xf5, 0x00, reg)
         if self.printer.get_start_args().get('debugoutput') is not None:
             return 0
         for retry in range(5):
-            params = self.tmcuart_send_cmd.send_with_response(
-                [self.oid, msg, 10], 'tmcuart_response', self.oid)
+            params = self._send_uart(msg, 10)
             val = decode_tmc2208_read(reg, params['read'])
             if val is not None:
                 return val
-        raise self.printer.config_error(
+        raise tmc2130.error(
             "Unable to read tmc2208 '%s' register %s" % (self.name, reg_name))
+    def set_registers(self, reg_vals):
+        # Write all registers and then verify them with a single IFCNT
+        # read (the uart can only handle one transfer at a time)
+        if self.printer.get_start_args().get('debugoutput') is not None:
+            return
+        try:
+            if self.ifcnt is None:
+                self.ifcnt = self.get_register("IFCNT")
+            ifcnt = self.ifcnt
+            for reg_name, val in reg_vals:
+                msg = encode_tmc2208_write(
+                    0xf5, 0x00, Registers[reg_name] | 0x80, val)
+                self._send_uart(msg, 0)
+            self.ifcnt = self.get_register("IFCNT")
+            if self.ifcnt == (ifcnt + len(reg_vals)) & 0xff:
+                return
+        except tmc2130.error as e:
+            logging.info("tmc2208 %s: %s", self.name, str(e))
+        # Fall back to writing and verifying each register separately
+        self.ifcnt = None
+        for reg_name, val in reg_vals:
+            self.set_register(reg_name, val)
     def set_register(self, reg_name, val):
         msg = encode_tmc2208_write(0xf5, 0x00, Registers[reg_name] | 0x80, val)
         if self.printer.get_start_args().get('debugoutput') is not None:
@@ -346,13 +383,19 @@ class TMC2208:
             ifcnt = self.ifcnt
             if ifcnt is None:
                 self.ifcnt = ifcnt = self.get_register("IFCNT")
-            params = self.tmcuart_send_cmd.send_with_response(
-                [self.oid, msg, 0], 'tmcuart_response', self.oid)
+            self._send_uart(msg, 0)
             self.ifcnt = self.get_register("IFCNT")
             if self.ifcnt == (ifcnt + 1) & 0xff:
                 return
-        raise self.printer.config_error(
+        raise tmc2130.error(
             "Unable to write tmc2208 '%s' register %s" % (self.name, reg_name))
+    def _read_status(self, reg_names):
+        return [(reg_name, self.get_register(reg_name))
+                for reg_name in reg_names]
+    def get_status(self, eventtime):
+        return self.status_poller.get_status(eventtime)
+    def stats(self, eventtime):
+        return self.status_poller.stats(eventtime)
     def get_microsteps(self):
         return 256 >> self.fields.get_field("MRES")
     def get_phase(self):
@@ -405,7 +448,7 @@ class TMC2208:
         for reg_name in ReadRegisters:
             try:
                 val = self.get_register(reg_name)
-            except self.printer.config_error as e:
+            except tmc2130.error as e:
                 raise gcode.error(str(e))
             # IOIN has different mappings depending on the driver type
             # (SEL_A field of IOIN reg)
@@ -202,6 +202,10 @@ class TMC2660:
         # Init Registers
         self._init_registers(self)
 
+        # Optional background status polling
+        self.status_poller = tmc2130.TMCStatusPoller(
+            config, self.fields, self._read_status)
+
         # Register ready/printing handlers
         self.idle_current_percentage = config.getint(
             'idle_current_percent', default=100, minval=0, maxval=100)
@@ -228,6 +232,16 @@ class TMC2660:
         pr = bytearray(params['response'])
         return (pr[0] << 16) | (pr[1] << 8) | pr[2]
 
+    def _read_status(self):
+        reg_name = "READRSP@RDSEL" + str(self.fields.get_field("RDSEL"))
+        return [(reg_name, self.get_response())]
+
+    def get_status(self, eventtime):
+        return self.status_poller.get_status(eventtime)
+
+    def stats(self, eventtime):
+        return self.status_poller.stats(eventtime)
+
     def get_microsteps(self):
         return 256 >> self.fields.get_field("MRES")
 
@@ -23,6 +23,7 @@ class ZTilt:
         if len(z_positions) < 2:
             raise config.error("z_tilt requires at least two z_positions")
         self.probe_helper = probe.ProbePointsHelper(config, self.probe_finalize)
+        self.retry_helper = probe.RetryHelper(config)
         self.z_steppers = []
         # Register Z_TILT_ADJUST command
         self.gcode = self.printer.lookup_object('gcode')
@@ -39,29 +40,27 @@ class ZTilt:
         self.z_steppers = z_steppers
     cmd_Z_TILT_ADJUST_help = "Adjust the Z tilt"
     def cmd_Z_TILT_ADJUST(self, params):
+        self.retry_helper.start()
         self.probe_helper.start_probe(params)
     def probe_finalize(self, offsets, positions):
-        # Setup for coordinate descent analysis
+        # Find the best fit plane through the probed points
         z_offset = offsets[2]
         logging.info("Calculating bed tilt with: %s", positions)
-        params = { 'x_adjust': 0., 'y_adjust': 0., 'z_adjust': z_offset }
-        # Perform coordinate descent
-        def adjusted_height(pos, params):
-            x, y, z = pos
-            return (z - x*params['x_adjust'] - y*params['y_adjust']
-                    - params['z_adjust'])
-        def errorfunc(params):
-            total_error = 0.
-            for pos in positions:
-                total_error += adjusted_height(pos, params)**2
-            return total_error
-        new_params = mathutil.coordinate_descent(
-            params.keys(), params, errorfunc)
+        try:
+            x_adjust, y_adjust, plane_z = mathutil.plane_fit(positions)
+        except ZeroDivisionError:
+            raise self.gcode.error(
+                "Unable to calculate bed tilt - probe points are collinear")
+        residuals, rms = mathutil.plane_residuals(
+            positions, x_adjust, y_adjust, plane_z)
+        logging.info("Calculated bed tilt parameters: x_adjust: %.6f"
+                     " y_adjust: %.6f z_adjust: %.6f residuals: %s",
+                     x_adjust, y_adjust, plane_z, residuals)
+        self.gcode.respond_info("Plane fit residuals:\n%s\nrms: %.6f" % (
+            "\n".join(["%.3f,%.3f: %.6f" % (pos[0], pos[1], r)
+                       for pos, r in zip(positions, residuals)]), rms))
         # Apply results
-        logging.info("Calculated bed tilt parameters: %s", new_params)
-        x_adjust = new_params['x_adjust']
-        y_adjust = new_params['y_adjust']
-        z_adjust = (new_params['z_adjust'] - z_offset
+        z_adjust = (plane_z - z_offset
                     - x_adjust * offsets[0] - y_adjust * offsets[1])
         try:
             self.adjust_steppers(x_adjust, y_adjust, z_adjust)
@@ -70,6 +69,7 @@ class ZTilt:
             for s in self.z_steppers:
                 s.set_ignore_move(False)
             raise
+        return self.retry_helper.check_retry(positions)
     def adjust_steppers(self, x_adjust, y_adjust, z_adjust):
         toolhead = self.printer.lookup_object('toolhead')
         curpos = toolhead.get_position()
@@ -32,6 +32,9 @@ class GCodeParser:
         self.pending_commands = []
         self.bytes_read = 0
         self.input_log = collections.deque([], 50)
+        # Cache of parsed scripts (from run_script_from_command)
+        self.script_cache = collections.OrderedDict()
+        self.script_hits = self.script_misses = 0
         # Command handling
         self.is_printer_ready = False
         self.base_gcode_handlers = self.gcode_handlers = {}
@@ -101,7 +104,8 @@ class GCodeParser:
         self.move_with_transform = transform.move
         self.position_with_transform = transform.get_position
     def stats(self, eventtime):
-        return False, "gcodein=%d" % (self.bytes_read,)
+        return False, "gcodein=%d script_hits=%d script_misses=%d" % (
+            self.bytes_read, self.script_hits, self.script_misses)
     def get_current_position(self):
         p = [lp - bp for lp, bp in zip(self.last_position, self.base_position)]
         p[3] /= self.extrude_factor
@@ -178,25 +182,29 @@ class GCodeParser:
         logging.info("\n".join(out))
     # Parse input into commands
     args_r = re.compile('([A-Z_]+|[A-Z*/])')
+    def parse_line(self, line):
+        # Ignore comments and leading/trailing spaces
+        line = origline = line.strip()
+        cpos = line.find(';')
+        if cpos >= 0:
+            line = line[:cpos]
+        # Break command into parts
+        parts = self.args_r.split(line.upper())[1:]
+        params = { parts[i]: parts[i+1].strip()
+                   for i in range(0, len(parts), 2) }
+        params['#original'] = origline
+        if parts and parts[0] == 'N':
+            # Skip line number at start of command
+            del parts[:2]
+        if not parts:
+            # Treat empty line as empty command
+            parts = ['', '']
+        params['#command'] = cmd = parts[0] + parts[1].strip()
+        return cmd, params
     def process_commands(self, commands, need_ack=True):
-        for line in commands:
-            # Ignore comments and leading/trailing spaces
-            line = origline = line.strip()
-            cpos = line.find(';')
-            if cpos >= 0:
-                line = line[:cpos]
-            # Break command into parts
-            parts = self.args_r.split(line.upper())[1:]
-            params = { parts[i]: parts[i+1].strip()
-                       for i in range(0, len(parts), 2) }
-            params['#original'] = origline
-            if parts and parts[0] == 'N':
-                # Skip line number at start of command
-                del parts[:2]
-            if not parts:
-                # Treat empty line as empty command
-                parts = ['', '']
-            params['#command'] = cmd = parts[0] + parts[1].strip()
+        self.process_parsed([self.parse_line(l) for l in commands], need_ack)
+    def process_parsed(self, commands, need_ack=True):
+        for cmd, params in commands:
             # Invoke handler for command
             self.need_ack = need_ack
             handler = self.gcode_handlers.get(cmd, self.cmd_default)
@@ -281,10 +289,26 @@ class GCodeParser:
             self.process_pending()
         self.is_processing_data = False
         return True
+    SCRIPT_CACHE_SIZE = 64
+    def parse_script(self, script):
+        # Parse a script, reusing the result of a recent identical script
+        commands = self.script_cache.pop(script, None)
+        if commands is None:
+            self.script_misses += 1
+            commands = [self.parse_line(l) for l in script.split('\n')]
+            if len(self.script_cache) >= self.SCRIPT_CACHE_SIZE:
+                self.script_cache.popitem(last=False)
+        else:
+            self.script_hits += 1
+        self.script_cache[script] = commands
+        return commands
     def run_script_from_command(self, script):
         prev_need_ack = self.need_ack
         try:
-            self.process_commands(script.split('\n'), need_ack=False)
+            # Cached commands are shared - pass copies of their params
+            commands = [(cmd, dict(params))
+                        for cmd, params in self.parse_script(script)]
+            self.process_parsed(commands, need_ack=False)
         finally:
             self.need_ack = prev_need_ack
     def run_script(self, script):
@@ -418,20 +442,24 @@ class GCodeParser:
             if temp > 0.:
                 self.respond_error("Heater not configured")
             return
-        print_time = self.toolhead.get_last_move_time()
         try:
-            heater.set_temp(print_time, temp)
+            heater.check_temp(temp)
         except heater.error as e:
             raise error(str(e))
         if wait and temp:
+            print_time = self.toolhead.get_last_move_time()
+            heater.set_temp(print_time, temp)
             self.bg_temp(heater)
+            return
+        self.toolhead.register_lookahead_callback(
+            (lambda print_time: heater.set_temp(print_time, temp)))
     def set_fan_speed(self, speed):
         if self.fan is None:
             if speed and not self.is_fileinput:
                 self.respond_info("Fan not configured")
             return
-        print_time = self.toolhead.get_last_move_time()
-        self.fan.set_speed(print_time, speed)
+        self.toolhead.register_lookahead_callback(
+            (lambda print_time: self.fan.set_speed(print_time, speed)))
     # G-Code special command handlers
     def cmd_default(self, params):
         if not self.is_printer_ready:
@@ -101,10 +101,12 @@ class Heater:
         return self.max_power
     def get_smooth_time(self):
         return self.smooth_time
-    def set_temp(self, print_time, degrees):
+    def check_temp(self, degrees):
         if degrees and (degrees < self.min_temp or degrees > self.max_temp):
             raise error("Requested temperature (%.1f) out of range (%.1f:%.1f)"
                         % (degrees, self.min_temp, self.max_temp))
+    def set_temp(self, print_time, degrees):
+        self.check_temp(degrees)
         with self.lock:
             self.target_temp = degrees
     def get_temp(self, eventtime):
@@ -142,9 +144,14 @@ class Heater:
         return {'temperature': smoothed_temp, 'target': target_temp}
     cmd_SET_HEATER_TEMPERATURE_help = "Sets a heater temperature"
     def cmd_SET_HEATER_TEMPERATURE(self, params):
-        print_time = self.printer.lookup_object('toolhead').get_last_move_time()
         temp = self.gcode.get_float('TARGET', params, 0.)
-        self.set_temp(print_time, temp)
+        try:
+            self.check_temp(temp)
+        except error as e:
+            raise self.gcode.error(str(e))
+        toolhead = self.printer.lookup_object('toolhead')
+        toolhead.register_lookahead_callback(
+            (lambda print_time: self.set_temp(print_time, temp)))
 
 
 ######################################################################
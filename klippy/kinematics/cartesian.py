@@ -31,6 +31,8 @@ class CartKinematics:
         # Check for dual carriage support
         self.dual_carriage_axis = None
         self.dual_carriage_rails = []
+        self.dual_carriage_active = 0
+        self.dual_carriage_pos = []
         if config.has_section('dual_carriage'):
             dc_config = config.getsection('dual_carriage')
             dc_axis = dc_config.getchoice('axis', {'x': 'x', 'y': 'y'})
@@ -40,6 +42,8 @@ class CartKinematics:
             dc_rail.set_max_jerk(max_halt_velocity, max_accel)
             self.dual_carriage_rails = [
                 self.rails[self.dual_carriage_axis], dc_rail]
+            self.dual_carriage_pos = [
+                r.get_commanded_position() for r in self.dual_carriage_rails]
             self.printer.lookup_object('gcode').register_command(
                 'SET_DUAL_CARRIAGE', self.cmd_SET_DUAL_CARRIAGE,
                 desc=self.cmd_SET_DUAL_CARRIAGE_help)
@@ -54,6 +58,8 @@ class CartKinematics:
             rail.set_position(newpos)
             if i in homing_axes:
                 self.limits[i] = rail.get_range()
+        self.dual_carriage_pos = [
+            r.get_commanded_position() for r in self.dual_carriage_rails]
     def _home_axis(self, homing_state, axis, rail):
         # Determine movement
         position_min, position_max = rail.get_range()
@@ -75,7 +81,7 @@ class CartKinematics:
         for axis in homing_state.get_axes():
             if axis == self.dual_carriage_axis:
                 dc1, dc2 = self.dual_carriage_rails
-                altc = self.rails[axis] == dc2
+                altc = self.dual_carriage_active
                 self._activate_carriage(0)
                 self._home_axis(homing_state, axis, dc1)
                 self._activate_carriage(1)
@@ -130,15 +136,22 @@ class CartKinematics:
     # Dual carriage support
     def _activate_carriage(self, carriage):
         toolhead = self.printer.lookup_object('toolhead')
-        toolhead.get_last_move_time()
         dc_rail = self.dual_carriage_rails[carriage]
         dc_axis = self.dual_carriage_axis
-        self.rails[dc_axis] = dc_rail
-        extruder_pos = toolhead.get_position()[3]
-        toolhead.set_position(self.calc_position() + [extruder_pos])
+        # Remember where the outgoing carriage was left and continue
+        # from the last position of the incoming carriage
+        newpos = toolhead.get_position()
+        self.dual_carriage_pos[self.dual_carriage_active] = newpos[dc_axis]
+        newpos[dc_axis] = self.dual_carriage_pos[carriage]
+        self.dual_carriage_active = carriage
         if self.limits[dc_axis][0] <= self.limits[dc_axis][1]:
             self.limits[dc_axis] = dc_rail.get_range()
-        self.need_motor_enable = True
+        # Swap the rail used for step generation once the moves of the
+        # outgoing carriage have been flushed
+        def switch_rail(print_time):
+            self.rails[dc_axis] = dc_rail
+            self.need_motor_enable = True
+        toolhead.queue_kinematic_change(newpos, switch_rail)
     cmd_SET_DUAL_CARRIAGE_help = "Set which carriage is active"
     def cmd_SET_DUAL_CARRIAGE(self, params):
         gcode = self.printer.lookup_object('gcode')
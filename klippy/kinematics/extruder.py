@@ -79,6 +79,9 @@ class PrinterExtruder:
     def check_move(self, move):
         move.extrude_r = move.axes_d[3] / move.move_d
         move.extrude_max_corner_v = 0.
+        # Pressure advance settings in effect when the move was queued
+        move.pressure_advance = self.pressure_advance
+        move.pressure_advance_lookahead_t = self.pressure_advance_lookahead_time
         if not self.heater.can_extrude:
             raise homing.EndstopError(
                 "Extrude below minimum temp\n"
@@ -121,14 +124,14 @@ class PrinterExtruder:
             move.extrude_r = prev_move.extrude_r
         return move.max_cruise_v2
     def lookahead(self, moves, flush_count, lazy):
-        lookahead_t = self.pressure_advance_lookahead_time
-        if not self.pressure_advance or not lookahead_t:
-            return flush_count
         # Calculate max_corner_v - the speed the head will accelerate
         # to after cornering.
         for i in range(flush_count):
             move = moves[i]
-            if not move.decel_t:
+            if not move.decel_t or not move.axes_d[3]:
+                continue
+            lookahead_t = move.pressure_advance_lookahead_t
+            if not move.pressure_advance or not lookahead_t:
                 continue
             cruise_v = move.cruise_v
             max_corner_v = 0.
@@ -172,9 +175,9 @@ class PrinterExtruder:
         extra_accel_v = extra_decel_v = 0.
         start_pos = self.extrude_pos
         if (axis_d >= 0. and (move.axes_d[0] or move.axes_d[1])
-            and self.pressure_advance):
+            and move.pressure_advance):
             # Calculate extra_accel_v
-            pressure_advance = self.pressure_advance * move.extrude_r
+            pressure_advance = move.pressure_advance * move.extrude_r
             prev_pressure_d = start_pos - move.start_pos[3]
             if accel_t:
                 npd = move.cruise_v * pressure_advance
@@ -203,13 +206,13 @@ class PrinterExtruder:
         extruder = self.printer.lookup_object('toolhead').get_extruder()
         extruder.cmd_SET_PRESSURE_ADVANCE(params)
     def cmd_SET_PRESSURE_ADVANCE(self, params):
-        self.printer.lookup_object('toolhead').get_last_move_time()
         gcode = self.printer.lookup_object('gcode')
         pressure_advance = gcode.get_float(
             'ADVANCE', params, self.pressure_advance, minval=0.)
         pressure_advance_lookahead_time = gcode.get_float(
             'ADVANCE_LOOKAHEAD_TIME', params,
             self.pressure_advance_lookahead_time, minval=0.)
+        # Queued moves keep the settings they were queued with
         self.pressure_advance = pressure_advance
         self.pressure_advance_lookahead_time = pressure_advance_lookahead_time
         msg = ("pressure_advance: %.6f\n"
@@ -47,19 +47,24 @@ Printer is shutdown
 
 class Printer:
     config_error = configfile.error
-    def __init__(self, input_fd, bglogger, start_args):
+    def __init__(self, input_fd, bglogger, start_args, main_reactor=None):
         self.bglogger = bglogger
         self.start_args = start_args
-        self.reactor = reactor.Reactor()
+        if main_reactor is None:
+            main_reactor = reactor.Reactor()
+        self.reactor = main_reactor
         self.reactor.register_callback(self._connect)
         self.state_message = message_startup
         self.is_shutdown = False
         self.run_result = None
         self.event_handlers = {}
+        self.startup_times = []
         gc = gcode.GCodeParser(self, input_fd)
         self.objects = collections.OrderedDict({'gcode': gc})
     def get_start_args(self):
         return self.start_args
+    def get_bglogger(self):
+        return self.bglogger
     def get_reactor(self):
         return self.reactor
     def get_state_message(self):
@@ -106,6 +111,7 @@ class Printer:
                                   'extras', module_name, '__init__.py')
         if not os.path.exists(py_name) and not os.path.exists(py_dirname):
             return None
+        start_time = time.time()
         mod = importlib.import_module('extras.' + module_name)
         init_func = 'load_config'
         if len(module_parts) > 1:
@@ -113,6 +119,7 @@ class Printer:
         init_func = getattr(mod, init_func, None)
         if init_func is not None:
             self.objects[section] = init_func(config.getsection(section))
+            self.startup_times.append((section, time.time() - start_time))
             return self.objects[section]
     def _read_config(self):
         self.objects['configfile'] = pconfig = configfile.PrinterConfig(self)
@@ -128,13 +135,36 @@ class Printer:
             m.add_printer_objects(config)
         # Validate that there are no undefined parameters in the config file
         pconfig.check_unused_options(config)
+    def _run_startup_handler(self, cb):
+        start_time = time.time()
+        cb()
+        name = getattr(cb, '__name__', '?')
+        if hasattr(cb, '__self__'):
+            name = "%s.%s" % (cb.__self__.__class__.__name__, name)
+        self.startup_times.append((name, time.time() - start_time))
+    def _log_startup_times(self, phase_times):
+        # phase_times holds cumulative times - report per phase durations
+        last_time = 0.
+        msg = []
+        for name, t in phase_times:
+            msg.append("%s=%.3f" % (name, t - last_time))
+            last_time = t
+        msg.append("total=%.3f" % (last_time,))
+        logging.info("Startup timing: %s", " ".join(msg))
+        slowest = sorted(self.startup_times, key=(lambda st: -st[1]))[:8]
+        logging.info("Slowest startup steps: %s", " ".join(
+            ["%s=%.3f" % (name.replace(' ', '_'), t) for name, t in slowest]))
     def _connect(self, eventtime):
+        phase_times = []
+        start_time = time.time()
         try:
             self._read_config()
+            phase_times.append(('config', time.time() - start_time))
             for cb in self.event_handlers.get("klippy:connect", []):
                 if self.state_message is not message_startup:
                     return
-                cb()
+                self._run_startup_handler(cb)
+            phase_times.append(('connect', time.time() - start_time))
         except (self.config_error, pins.error) as e:
             logging.exception("Config error")
             self._set_state("%s%s" % (str(e), message_restart))
@@ -157,7 +187,9 @@ class Printer:
             for cb in self.event_handlers.get("klippy:ready", []):
                 if self.state_message is not message_ready:
                     return
-                cb()
+                self._run_startup_handler(cb)
+            phase_times.append(('ready', time.time() - start_time))
+            self._log_startup_times(phase_times)
         except Exception as e:
             logging.exception("Unhandled exception during ready callback")
             self.invoke_shutdown("Internal error during ready callback: %s" % (
@@ -173,6 +205,8 @@ class Printer:
         except:
             logging.exception("Unhandled exception during run")
             return "error_exit"
+        return self.finish_run()
+    def finish_run(self):
         # Check restart flags
         run_result = self.run_result
         try:
@@ -205,6 +239,88 @@ class Printer:
         self.reactor.end()
 
 
+######################################################################
+# Multiple printer host mode
+######################################################################
+
+# Run several printers in one process using a shared reactor.  Each
+# printer has its own objects, input tty and log, and is restarted
+# independently of the others.
+class PrinterSupervisor:
+    def __init__(self, bglogger, versions):
+        self.bglogger = bglogger
+        self.versions = versions
+        self.reactor = reactor.Reactor()
+        self.printers = {}
+        self.result = 'exit'
+        if bglogger is not None:
+            # Log messages from a printer's callbacks to that printer's log
+            bglogger.set_route_callback(reactor.get_client_context)
+    def add_printer(self, input_fd, start_args, bglogger):
+        index = len(self.printers)
+        self.printers[index] = None
+        self._start_printer(index, input_fd, start_args, bglogger)
+    def _start_printer(self, index, input_fd, start_args, bglogger):
+        logging.info("Starting printer %d (%s)", index,
+                     start_args['config_file'])
+        if bglogger is not None:
+            bglogger.clear_rollover_info()
+            bglogger.set_rollover_info('versions', self.versions)
+        ending = []
+        def end_callback():
+            # Tear down the printer outside of its own call stack
+            if not ending:
+                ending.append(True)
+                self.reactor.register_callback(
+                    (lambda e: self._end_printer(index)))
+        client = reactor.ReactorClient(self.reactor, end_callback, bglogger)
+        def create_printer():
+            if (self.versions is not None
+                and start_args['start_reason'] == 'startup'):
+                logging.info(self.versions)
+            return Printer(input_fd, bglogger, start_args, client)
+        printer = client.wrap(create_printer)()
+        self.printers[index] = (printer, client, input_fd, start_args,
+                                bglogger)
+    def _end_printer(self, index):
+        printer, client, input_fd, start_args, bglogger = self.printers[index]
+        res = client.wrap(printer.finish_run)()
+        client.release()
+        if client.is_error:
+            res = 'error_exit'
+        if res in ['exit', 'error_exit']:
+            logging.info("Printer %d exited (%s)", index, res)
+            if res == 'error_exit':
+                self.result = res
+            del self.printers[index]
+            if bglogger is not None:
+                bglogger.stop()
+            if not self.printers:
+                self.reactor.end()
+            return
+        logging.info("Restarting printer %d", index)
+        start_args['start_reason'] = res
+        self.reactor.register_callback(
+            (lambda e: self._start_printer(index, input_fd, start_args,
+                                           bglogger)),
+            self.reactor.monotonic() + 1.)
+    def run(self):
+        systime = time.time()
+        logging.info("Start %d printers at %s (%.1f %.1f)",
+                     len(self.printers), time.asctime(time.localtime(systime)),
+                     systime, self.reactor.monotonic())
+        try:
+            self.reactor.run()
+        except:
+            logging.exception("Unhandled exception during run")
+            self.result = "error_exit"
+        for printer, client, input_fd, start_args, bglogger in (
+                self.printers.values()):
+            if bglogger is not None:
+                bglogger.stop()
+        return self.result
+
+
 ######################################################################
 # Startup
 ######################################################################
@@ -219,7 +335,7 @@ def arg_dictionary(option, opt_str, value, parser):
     parser.values.dictionary[key] = fname
 
 def main():
-    usage = "%prog [options] <config file>"
+    usage = "%prog [options] <config file> [<config file> ...]"
     opts = optparse.OptionParser(usage)
     opts.add_option("-i", "--debuginput", dest="debuginput",
                     help="read commands from file instead of from tty port")
@@ -228,6 +344,9 @@ def main():
                     help="input tty name (default is /tmp/printer)")
     opts.add_option("-l", "--logfile", dest="logfile",
                     help="write log to file instead of stderr")
+    opts.add_option("--stats-file", dest="statsfile",
+                    help="also write statistics as json records to file"
+                    " (requires -l)")
     opts.add_option("-v", action="store_true", dest="verbose",
                     help="enable debug messages")
     opts.add_option("-o", "--debugoutput", dest="debugoutput",
@@ -235,10 +354,18 @@ def main():
     opts.add_option("-d", "--dictionary", dest="dictionary", type="string",
                     action="callback", callback=arg_dictionary,
                     help="file to read for mcu protocol dictionary")
+    opts.add_option("-c", "--identify-cache", dest="identify_cache",
+                    help="private directory to cache mcu protocol"
+                    " dictionaries in")
     options, args = opts.parse_args()
-    if len(args) != 1:
+    if len(args) < 1:
         opts.error("Incorrect number of arguments")
-    start_args = {'config_file': args[0], 'start_reason': 'startup'}
+    if len(args) > 1 and options.debuginput:
+        opts.error("Can not use debuginput with multiple config files")
+    if options.statsfile and not options.logfile:
+        opts.error("The stats file requires a log file (-l)")
+    start_args = {'config_file': args[0], 'start_reason': 'startup',
+                  'identify_cache': options.identify_cache}
 
     input_fd = bglogger = None
 
@@ -249,17 +376,20 @@ def main():
         start_args['debuginput'] = options.debuginput
         debuginput = open(options.debuginput, 'rb')
         input_fd = debuginput.fileno()
-    else:
+    elif len(args) == 1:
         input_fd = util.create_pty(options.inputtty)
     if options.debugoutput:
         start_args['debugoutput'] = options.debugoutput
         start_args.update(options.dictionary)
     if options.logfile:
-        bglogger = queuelogger.setup_bg_logging(options.logfile, debuglevel)
+        bglogger = queuelogger.setup_bg_logging(options.logfile, debuglevel,
+                                                options.statsfile)
+        start_args['stats_file'] = options.statsfile
     else:
         logging.basicConfig(level=debuglevel)
     logging.info("Starting Klippy...")
     start_args['software_version'] = util.get_git_version()
+    versions = None
     if bglogger is not None:
         versions = "\n".join([
             "Args: %s" % (sys.argv,),
@@ -268,6 +398,37 @@ def main():
             "Python: %s" % (repr(sys.version),)])
         logging.info(versions)
 
+    if len(args) > 1:
+        # Run all printers in this process - each printer gets its
+        # own input tty, log file (and debug output and stats files)
+        # with an index suffix
+        if bglogger is not None:
+            bglogger.clear_rollover_info()
+            bglogger.set_rollover_info('versions', versions)
+        supervisor = PrinterSupervisor(bglogger, versions)
+        for index, config_file in enumerate(args):
+            pstart_args = dict(start_args)
+            pstart_args['config_file'] = config_file
+            if options.debugoutput:
+                pstart_args['debugoutput'] = "%s-%d" % (
+                    options.debugoutput, index)
+            pbglogger = None
+            if bglogger is not None:
+                if options.statsfile:
+                    pstart_args['stats_file'] = "%s-%d" % (
+                        options.statsfile, index)
+                pbglogger = queuelogger.QueueListener(
+                    "%s-%d" % (options.logfile, index),
+                    pstart_args['stats_file'])
+            input_fd = util.create_pty("%s-%d" % (options.inputtty, index))
+            supervisor.add_printer(input_fd, pstart_args, pbglogger)
+        res = supervisor.run()
+        if bglogger is not None:
+            bglogger.stop()
+        if res == 'error_exit':
+            sys.exit(-1)
+        return
+
     # Start Printer() class
     while 1:
         if bglogger is not None:
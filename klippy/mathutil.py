@@ -3,55 +3,20 @@
 # Copyright (C) 2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import math, logging, multiprocessing
+import math, logging, time
 
 
 ######################################################################
-# Coordinate descent
+# Background calculations
 ######################################################################
 
-# Helper code that implements coordinate descent
-def coordinate_descent(adj_params, params, error_func):
-    # Define potential changes
-    params = dict(params)
-    dp = {param_name: 1. for param_name in adj_params}
-    # Calculate the error
-    best_err = error_func(params)
-    logging.info("Coordinate descent initial error: %s", best_err)
-
-    threshold = 0.00001
-    rounds = 0
-
-    while sum(dp.values()) > threshold and rounds < 10000:
-        rounds += 1
-        for param_name in adj_params:
-            orig = params[param_name]
-            params[param_name] = orig + dp[param_name]
-            err = error_func(params)
-            if err < best_err:
-                # There was some improvement
-                best_err = err
-                dp[param_name] *= 1.1
-                continue
-            params[param_name] = orig - dp[param_name]
-            err = error_func(params)
-            if err < best_err:
-                # There was some improvement
-                best_err = err
-                dp[param_name] *= 1.1
-                continue
-            params[param_name] = orig
-            dp[param_name] *= 0.9
-    logging.info("Coordinate descent best_err: %s  rounds: %d",
-                 best_err, rounds)
-    return params
-
-# Helper to run the coordinate descent function in a background
-# process so that it does not block the main thread.
-def background_coordinate_descent(printer, adj_params, params, error_func):
+# Helper to run a calculation function in a background process so
+# that it does not block the main thread.
+def background_calculation(printer, calc_func):
+    import multiprocessing
     parent_conn, child_conn = multiprocessing.Pipe()
     def wrapper():
-        res = coordinate_descent(adj_params, params, error_func)
+        res = calc_func()
         child_conn.send(res)
         child_conn.close()
     # Start a process to perform the calculation
@@ -74,6 +39,113 @@ def background_coordinate_descent(printer, adj_params, params, error_func):
     return res
 
 
+######################################################################
+# Levenberg-Marquardt least squares
+######################################################################
+
+# Helper code that minimizes the sum of the squares of the values
+# returned by residual_func(params).  The jacobian is estimated with
+# forward differences.  Returns a tuple of the best params found and
+# a dictionary describing the solve (iterations, error, time).
+def levenberg_marquardt(adj_params, params, residual_func,
+                        max_iterations=100):
+    start_time = time.time()
+    params = dict(params)
+    residuals = residual_func(params)
+    best_err = sum([r**2 for r in residuals])
+    logging.info("Levenberg-Marquardt initial error: %s", best_err)
+    damping = 0.001
+    iterations = 0
+    while iterations < max_iterations:
+        iterations += 1
+        # Estimate the jacobian (one row per parameter)
+        jacobian = []
+        for param_name in adj_params:
+            orig = params[param_name]
+            step = 0.000001 * max(abs(orig), 1.)
+            params[param_name] = orig + step
+            step_residuals = residual_func(params)
+            params[param_name] = orig
+            jacobian.append([(sr - r) / step
+                             for sr, r in zip(step_residuals, residuals)])
+        # Build the normal equations
+        jtj = [[sum([a * b for a, b in zip(row1, row2)]) for row2 in jacobian]
+               for row1 in jacobian]
+        jtr = [-sum([a * r for a, r in zip(row, residuals)])
+               for row in jacobian]
+        # Find a damping factor that reduces the error
+        while 1:
+            damped = [list(row) for row in jtj]
+            for i, row in enumerate(damped):
+                row[i] += damping * max(jtj[i][i], 0.000000000001)
+            new_params = dict(params)
+            try:
+                steps = solve_linear(damped, jtr)
+                for param_name, step in zip(adj_params, steps):
+                    new_params[param_name] += step
+                new_residuals = residual_func(new_params)
+            except (ValueError, ZeroDivisionError):
+                new_residuals = None
+            if new_residuals is not None:
+                new_err = sum([r**2 for r in new_residuals])
+                if new_err < best_err:
+                    break
+            damping *= 10.
+            if damping > 10000000000.:
+                break
+        if damping > 10000000000.:
+            # Unable to make further progress
+            break
+        improvement = best_err - new_err
+        params, residuals, best_err = new_params, new_residuals, new_err
+        damping = max(damping * 0.1, 0.000000001)
+        if improvement <= 0.000000001 * best_err or best_err < 1e-20:
+            break
+    info = {'iterations': iterations, 'error': best_err,
+            'time': time.time() - start_time}
+    logging.info("Levenberg-Marquardt best_err: %s  iterations: %d"
+                 "  time: %.3fs", best_err, iterations, info['time'])
+    return params, info
+
+def background_levenberg_marquardt(printer, adj_params, params, residual_func):
+    return background_calculation(printer, (
+        lambda: levenberg_marquardt(adj_params, params, residual_func)))
+
+
+######################################################################
+# Plane fitting
+######################################################################
+
+# Find the plane z = x*x_adjust + y*y_adjust + z_adjust that best fits
+# (in a least squares sense) the given list of (x, y, z) positions.
+# Returns the tuple (x_adjust, y_adjust, z_adjust).
+def plane_fit(positions):
+    count = float(len(positions))
+    # Center the coordinates to improve numerical stability
+    cx = sum([p[0] for p in positions]) / count
+    cy = sum([p[1] for p in positions]) / count
+    cz = sum([p[2] for p in positions]) / count
+    sxx = sxy = syy = sxz = syz = 0.
+    for p in positions:
+        x, y, z = p[0] - cx, p[1] - cy, p[2] - cz
+        sxx += x*x
+        sxy += x*y
+        syy += y*y
+        sxz += x*z
+        syz += y*z
+    x_adjust, y_adjust = solve_linear([[sxx, sxy], [sxy, syy]], [sxz, syz])
+    z_adjust = cz - x_adjust*cx - y_adjust*cy
+    return x_adjust, y_adjust, z_adjust
+
+# Return the distance of each position from the given plane along with
+# the root-mean-square of those distances.
+def plane_residuals(positions, x_adjust, y_adjust, z_adjust):
+    residuals = [p[2] - p[0]*x_adjust - p[1]*y_adjust - z_adjust
+                 for p in positions]
+    rms = math.sqrt(sum([r**2 for r in residuals]) / len(residuals))
+    return residuals, rms
+
+
 ######################################################################
 # Trilateration
 ######################################################################
@@ -126,3 +198,32 @@ def matrix_sub(m1, m2):
 
 def matrix_mul(m1, s):
     return [m1[0]*s, m1[1]*s, m1[2]*s]
+
+
+######################################################################
+# Linear equation helper
+######################################################################
+
+# Solve the square linear system m * x = v using gaussian elimination
+# with partial pivoting.  The matrix is given as a list of rows.
+def solve_linear(m, v):
+    count = len(v)
+    rows = [list(row) + [val] for row, val in zip(m, v)]
+    for col in range(count):
+        pivot = max(range(col, count), key=(lambda r: abs(rows[r][col])))
+        if not rows[pivot][col]:
+            raise ZeroDivisionError("Singular matrix")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        prow = rows[col]
+        for row in rows[col+1:]:
+            factor = row[col] / prow[col]
+            if factor:
+                for i in range(col, count + 1):
+                    row[i] -= factor * prow[i]
+    res = [0.] * count
+    for col in range(count - 1, -1, -1):
+        row = rows[col]
+        res[col] = (row[count] - sum([row[i] * res[i]
+                                      for i in range(col + 1, count)])
+                    ) / row[col]
+    return res
@@ -418,6 +418,9 @@ class MCU_adc:
         if self._callback is not None:
             self._callback(last_read_time, last_value)
 
+# Resolved and encoded config of each mcu from the last connect
+config_cache = {}
+
 class MCU:
     error = error
     def __init__(self, config, clocksync):
@@ -427,7 +430,6 @@ class MCU:
         self._name = config.get_name()
         if self._name.startswith('mcu '):
             self._name = self._name[4:]
-        self._printer.register_event_handler("klippy:connect", self._connect)
         self._printer.register_event_handler("klippy:shutdown", self._shutdown)
         self._printer.register_event_handler("klippy:disconnect",
                                              self._disconnect)
@@ -437,8 +439,12 @@ class MCU:
         if not (self._serialport.startswith("/dev/rpmsg_")
                 or self._serialport.startswith("/tmp/klipper_host_")):
             baud = config.getint('baud', 250000, minval=2400)
+        identify_cache = None
+        cache_dir = self._printer.get_start_args().get('identify_cache')
+        if cache_dir:
+            identify_cache = serialhdl.IdentifyCache(cache_dir)
         self._serial = serialhdl.SerialReader(
-            self._reactor, self._serialport, baud)
+            self._reactor, self._serialport, baud, identify_cache)
         # Restarts
         self._restart_method = 'command'
         if baud:
@@ -537,32 +543,50 @@ class MCU:
         self._add_custom()
         self._config_cmds.insert(0, "allocate_oids count=%d" % (
             self._oid_count,))
-        # Resolve pin names
-        mcu_type = self._serial.msgparser.get_constant('MCU')
+        # Resolve pin names and encode commands (reusing the results
+        # of the last connect if nothing has changed)
+        msgparser = self._serial.msgparser
         ppins = self._printer.lookup_object('pins')
         reserved_pins = ppins.get_reserved_pins(self._name)
-        pin_resolver = pins.PinResolver(mcu_type, reserved_pins)
-        if self._pin_map is not None:
-            pin_resolver.update_aliases(self._pin_map)
-        for i, cmd in enumerate(self._config_cmds):
-            self._config_cmds[i] = pin_resolver.update_command(cmd)
-        for i, cmd in enumerate(self._init_cmds):
-            self._init_cmds[i] = pin_resolver.update_command(cmd)
-        # Calculate config CRC
-        config_crc = zlib.crc32('\n'.join(self._config_cmds)) & 0xffffffff
-        self.add_config_cmd("finalize_config crc=%d" % (config_crc,))
+        cache_key = (msgparser, self._pin_map,
+                     tuple(sorted(reserved_pins.items())),
+                     tuple(self._config_cmds), tuple(self._init_cmds))
+        cached = config_cache.get(self._serialport)
+        if cached is None or cached[0] != cache_key:
+            cached = (cache_key,) + self._build_config(reserved_pins)
+            config_cache[self._serialport] = cached
+        config_cmds, init_cmds, config_crc, config_data, init_data = cached[1:]
+        self._config_cmds = list(config_cmds)
+        self._init_cmds = list(init_cmds)
         # Transmit config messages (if needed)
+        cmd_queue = self._serial.default_cmd_queue
         if prev_crc is None:
             logging.info("Sending MCU '%s' printer configuration...",
                          self._name)
-            for c in self._config_cmds:
-                self._serial.send(c)
+            self._serial.raw_send_multiple(config_data, 0, 0, cmd_queue)
         elif config_crc != prev_crc:
             self._check_restart("CRC mismatch")
             raise error("MCU '%s' CRC does not match config" % (self._name,))
         # Transmit init messages
-        for c in self._init_cmds:
-            self._serial.send(c)
+        self._serial.raw_send_multiple(init_data, 0, 0, cmd_queue)
+    def _build_config(self, reserved_pins):
+        msgparser = self._serial.msgparser
+        # Resolve pin names
+        mcu_type = msgparser.get_constant('MCU')
+        pin_resolver = pins.PinResolver(mcu_type, reserved_pins)
+        if self._pin_map is not None:
+            pin_resolver.update_aliases(self._pin_map)
+        config_cmds = [pin_resolver.update_command(c)
+                       for c in self._config_cmds]
+        init_cmds = [pin_resolver.update_command(c) for c in self._init_cmds]
+        # Calculate config CRC
+        config_crc = zlib.crc32('\n'.join(config_cmds)) & 0xffffffff
+        config_cmds.append("finalize_config crc=%d" % (config_crc,))
+        # Encode commands
+        config_data = [msgparser.create_command(c) for c in config_cmds]
+        init_data = [msgparser.create_command(c) for c in init_cmds]
+        return (tuple(config_cmds), tuple(init_cmds), config_crc,
+                [d for d in config_data if d], [d for d in init_data if d])
     def _send_get_config(self):
         get_config_cmd = self.lookup_command("get_config")
         if self.is_fileoutput():
@@ -600,16 +624,19 @@ class MCU:
             self._move_count)
         self._ffi_lib.steppersync_set_time(
             self._steppersync, 0., self._mcu_freq)
-    def _connect(self):
+    def _connect_serial(self):
         if self.is_fileoutput():
             self._connect_file()
-        else:
-            if (self._restart_method == 'rpi_usb'
-                and not os.path.exists(self._serialport)):
-                # Try toggling usb power
-                self._check_restart("enable power")
-            self._serial.connect()
+            return
+        if (self._restart_method == 'rpi_usb'
+            and not os.path.exists(self._serialport)):
+            # Try toggling usb power
+            self._check_restart("enable power")
+        self._serial.connect()
+    def _connect_clocksync(self):
+        if not self.is_fileoutput():
             self._clocksync.connect(self._serial)
+    def _connect_config(self):
         msgparser = self._serial.msgparser
         name = self._name
         log_info = [
@@ -709,6 +736,7 @@ class MCU:
         return self._reactor.monotonic()
     # Restarts
     def _disconnect(self):
+        self._clocksync.disconnect()
         self._serial.disconnect()
         if self._steppersync is not None:
             self._ffi_lib.steppersync_free(self._steppersync)
@@ -814,14 +842,70 @@ def error_help(msg):
                 return help_msg
     return ""
 
+# Connect to all mcus concurrently (each in its own reactor greenlet)
+class MCUConnect:
+    def __init__(self, printer, mcus):
+        self.printer = printer
+        self.reactor = printer.get_reactor()
+        self.mcus = mcus
+        printer.register_event_handler("klippy:connect", self._connect)
+    def _run_parallel(self, phase_name, phase, mcus, timing):
+        results = []
+        def make_callback(mcu):
+            def callback(eventtime):
+                try:
+                    phase(mcu)
+                except:
+                    results.append(sys.exc_info())
+                    return
+                timing[mcu][phase_name] = self.reactor.monotonic() - eventtime
+                results.append(None)
+            return callback
+        for mcu in mcus:
+            self.reactor.register_callback(make_callback(mcu))
+        # Wait for all mcus to complete before reporting any failure
+        eventtime = self.reactor.monotonic()
+        while len(results) < len(mcus):
+            eventtime = self.reactor.pause(eventtime + 0.005)
+        for res in results:
+            if res is not None:
+                # Python 2 syntax to re-raise with the original traceback
+                # (this would become six.reraise() or raise ... from ...
+                # if the host code moves to Python 3)
+                raise res[0], res[1], res[2]
+    def _connect(self):
+        timing = {mcu: {} for mcu in self.mcus}
+        try:
+            self._run_parallel('serial', MCU._connect_serial, self.mcus,
+                               timing)
+            # Secondary mcus synchronize to the primary mcu clock, so it
+            # must be synchronized first
+            self._run_parallel('clock', MCU._connect_clocksync,
+                               self.mcus[:1], timing)
+            self._run_parallel('clock', MCU._connect_clocksync,
+                               self.mcus[1:], timing)
+            self._run_parallel('config', MCU._connect_config, self.mcus,
+                               timing)
+        finally:
+            # Report the phases that completed (even on a failure)
+            for mcu in self.mcus:
+                t = timing[mcu]
+                phases = ["%s=%.3f" % (name, t[name])
+                          for name in ['serial', 'clock', 'config']
+                          if name in t]
+                logging.info("MCU '%s' connect timing: %s",
+                             mcu.get_name(), " ".join(phases))
+
 def add_printer_objects(config):
     printer = config.get_printer()
     reactor = printer.get_reactor()
     mainsync = clocksync.ClockSync(reactor)
-    printer.add_object('mcu', MCU(config.getsection('mcu'), mainsync))
+    mcus = [MCU(config.getsection('mcu'), mainsync)]
+    printer.add_object('mcu', mcus[0])
     for s in config.get_prefix_sections('mcu '):
-        printer.add_object(s.section, MCU(
-            s, clocksync.SecondarySync(reactor, mainsync)))
+        mcus.append(MCU(s, clocksync.SecondarySync(reactor, mainsync)))
+        printer.add_object(s.section, mcus[-1])
+    MCUConnect(printer, mcus)
 
 def get_printer_mcu(printer, name):
     if name == 'mcu':
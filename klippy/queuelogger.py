@@ -3,41 +3,124 @@
 # Copyright (C) 2016,2017  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, logging.handlers, threading, Queue, time
+import logging, logging.handlers, threading, Queue, time, json
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 100
+
+# Argument types that may be formatted later in the background thread
+IMMUTABLE_TYPES = (str, unicode, int, long, float, bool, type(None))
 
 # Class to forward all messages through a queue to a background thread
 class QueueHandler(logging.Handler):
-    def __init__(self, queue):
+    def __init__(self, bglogger):
         logging.Handler.__init__(self)
-        self.queue = queue
+        self.bglogger = bglogger
     def emit(self, record):
         try:
-            self.format(record)
-            record.msg = record.message
-            record.args = None
-            record.exc_info = None
-            self.queue.put_nowait(record)
+            args = record.args
+            if (record.exc_info is not None or not isinstance(args, tuple)
+                or [1 for a in args if type(a) not in IMMUTABLE_TYPES]):
+                # Arguments may change - format now
+                self.format(record)
+                record.msg = record.message
+                record.args = None
+                record.exc_info = None
+            self.bglogger.queue_record(record)
         except Exception:
             self.handleError(record)
 
 # Class to poll a queue in a background thread and log each message
 class QueueListener(logging.handlers.TimedRotatingFileHandler):
-    def __init__(self, filename):
+    def __init__(self, filename, stats_filename=None):
         logging.handlers.TimedRotatingFileHandler.__init__(
             self, filename, when='midnight', backupCount=5)
+        # Optional file of stats records (one json object per line)
+        self.stats_handler = None
+        if stats_filename:
+            self.stats_handler = logging.handlers.TimedRotatingFileHandler(
+                stats_filename, when='midnight', backupCount=5)
+        # The queue is only limited for low priority records (see
+        # queue_record) so that adding a record never blocks
         self.bg_queue = Queue.Queue()
+        self.in_batch = False
+        # Statistics
+        self.drop_count = self.delay_count = self.reported_drops = 0
+        self.batch_count = self.record_count = self.max_queued = 0
         self.bg_thread = threading.Thread(target=self._bg_thread)
         self.bg_thread.start()
         self.rollover_info = {}
+        self.route_callback = None
+    def set_route_callback(self, callback):
+        # The callback returns the QueueListener that should log a
+        # record from the current context (or None to log it here)
+        self.route_callback = callback
+    def queue_record(self, record):
+        # Called from any thread
+        if self.route_callback is not None:
+            bglogger = self.route_callback()
+            if bglogger is not None:
+                bglogger.queue_record(record)
+                return
+        if self.bg_queue.qsize() >= QUEUE_SIZE:
+            if record.levelno < logging.WARNING:
+                self.drop_count += 1
+                return
+            # Queue warnings and errors beyond the limit
+            self.delay_count += 1
+        self.bg_queue.put_nowait(record)
     def _bg_thread(self):
+        bg_queue = self.bg_queue
         while 1:
-            record = self.bg_queue.get(True)
-            if record is None:
+            records = [bg_queue.get(True)]
+            queued = bg_queue.qsize()
+            if queued > self.max_queued:
+                self.max_queued = queued
+            while records[-1] is not None and len(records) < BATCH_SIZE:
+                try:
+                    records.append(bg_queue.get_nowait())
+                except Queue.Empty:
+                    break
+            is_stop = records[-1] is None
+            if is_stop:
+                del records[-1]
+            # Write the batch with a single flush
+            self.in_batch = True
+            for record in records:
+                self.handle(record)
+                stats = getattr(record, 'stats', None)
+                if stats is not None and self.stats_handler is not None:
+                    self.stats_handler.handle(logging.makeLogRecord({
+                        'msg': json.dumps(stats, sort_keys=True),
+                        'levelno': logging.INFO}))
+            drop_count = self.drop_count
+            if drop_count != self.reported_drops:
+                self.emit(logging.makeLogRecord({
+                    'msg': "Log queue full - dropped %d messages" % (
+                        drop_count - self.reported_drops,),
+                    'levelno': logging.INFO}))
+                self.reported_drops = drop_count
+            self.in_batch = False
+            self.flush()
+            self.batch_count += 1
+            self.record_count += len(records)
+            if is_stop:
                 break
-            self.handle(record)
+    def flush(self):
+        if not self.in_batch:
+            logging.handlers.TimedRotatingFileHandler.flush(self)
     def stop(self):
-        self.bg_queue.put_nowait(None)
+        self.bg_queue.put(None)
         self.bg_thread.join()
+        if self.stats_handler is not None:
+            self.stats_handler.close()
+    def stats(self, eventtime):
+        max_queued = self.max_queued
+        self.max_queued = 0
+        return False, ("logger: records=%d batches=%d max_queued=%d"
+                       " dropped=%d delayed=%d" % (
+                           self.record_count, self.batch_count, max_queued,
+                           self.drop_count, self.delay_count))
     def set_rollover_info(self, name, info):
         self.rollover_info[name] = info
     def clear_rollover_info(self):
@@ -52,9 +135,9 @@ class QueueListener(logging.handlers.TimedRotatingFileHandler):
         self.emit(logging.makeLogRecord(
             {'msg': "\n".join(lines), 'level': logging.INFO}))
 
-def setup_bg_logging(filename, debuglevel):
-    ql = QueueListener(filename)
-    qh = QueueHandler(ql.bg_queue)
+def setup_bg_logging(filename, debuglevel, stats_filename=None):
+    ql = QueueListener(filename, stats_filename)
+    qh = QueueHandler(ql)
     root = logging.getLogger()
     root.addHandler(qh)
     root.setLevel(debuglevel)
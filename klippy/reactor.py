@@ -3,7 +3,7 @@
 # Copyright (C) 2016-2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, select, math, time, Queue
+import os, select, math, time, logging, Queue
 import greenlet
 import chelper, util
 
@@ -34,6 +34,35 @@ class ReactorGreenlet(greenlet.greenlet):
         greenlet.greenlet.__init__(self, run=run)
         self.timer = None
 
+class ReactorMutex:
+    def __init__(self, reactor, is_locked):
+        self.reactor = reactor
+        self.is_locked = is_locked
+        self.next_pending = False
+        self.queue = []
+        self.lock = self.__enter__
+        self.unlock = self.__exit__
+    def test(self):
+        return self.is_locked
+    def __enter__(self):
+        if not self.is_locked:
+            self.is_locked = True
+            return
+        g = greenlet.getcurrent()
+        self.queue.append(g)
+        while 1:
+            self.reactor.pause(self.reactor.NEVER)
+            if self.next_pending and self.queue[0] is g:
+                self.next_pending = False
+                self.queue.pop(0)
+                return
+    def __exit__(self, type=None, value=None, tb=None):
+        if not self.queue:
+            self.is_locked = False
+            return
+        self.next_pending = True
+        self.reactor.update_timer(self.queue[0].timer, self.reactor.NOW)
+
 class SelectReactor:
     NOW = 0.
     NEVER = 9999999999999999.
@@ -87,6 +116,9 @@ class SelectReactor:
         if eventtime >= self._next_timer:
             return 0.
         return min(1., max(.001, self._next_timer - self.monotonic()))
+    # Mutexes
+    def mutex(self, is_locked=False):
+        return ReactorMutex(self, is_locked)
     # Callbacks
     def register_callback(self, callback, waketime = NOW):
         ReactorCallback(self, callback, waketime)
@@ -136,6 +168,8 @@ class SelectReactor:
             g_next = ReactorGreenlet(run=self._dispatch_loop)
         g_next.parent = g.parent
         g.timer = self.register_timer(g.switch, waketime)
+        # Force a full timer check in the new dispatch greenlet
+        self._next_timer = self.NOW
         return g_next.switch()
     def _end_greenlet(self, g_old):
         # Cache this greenlet for later use
@@ -245,6 +279,89 @@ class EPollReactor(SelectReactor):
                     break
         self._g_dispatch = None
 
+# Wrapper around a reactor that is shared by several printers.  It
+# tracks the timers and file descriptors registered through it so
+# that they can all be released when that printer exits.  The
+# optional context is available (via get_client_context()) while one
+# of the client's callbacks is running.
+class ReactorClient:
+    NOW = SelectReactor.NOW
+    NEVER = SelectReactor.NEVER
+    def __init__(self, reactor, end_callback, context=None):
+        self._reactor = reactor
+        self._end_callback = end_callback
+        self._context = context
+        self._timers = []
+        self._fds = []
+        self._is_active = True
+        self.is_error = False
+        self.monotonic = reactor.monotonic
+        self.update_timer = reactor.update_timer
+        self.pause = reactor.pause
+        self.mutex = reactor.mutex
+    def wrap(self, callback):
+        # Return a callback that runs with this client's context
+        def client_callback(*args):
+            g = greenlet.getcurrent()
+            prev_context = getattr(g, 'client_context', None)
+            g.client_context = self._context
+            try:
+                return callback(*args)
+            finally:
+                g.client_context = prev_context
+        return client_callback
+    def _wrap_handler(self, callback):
+        # An unhandled exception in a callback only ends this client
+        def handler_callback(*args):
+            try:
+                return callback(*args)
+            except Exception:
+                logging.exception("Unhandled exception in reactor client")
+                self.is_error = True
+                self.end()
+                return self.NEVER
+        return self.wrap(handler_callback)
+    def register_timer(self, callback, waketime=NEVER):
+        handler = self._reactor.register_timer(
+            self._wrap_handler(callback), waketime)
+        self._timers.append(handler)
+        return handler
+    def unregister_timer(self, handler):
+        # The handler may already be gone if the client was released
+        if handler in self._timers:
+            self._timers.remove(handler)
+            self._reactor.unregister_timer(handler)
+    def register_callback(self, callback, waketime=NOW):
+        ReactorCallback(self, callback, waketime)
+    def register_async_callback(self, callback):
+        def async_callback(eventtime):
+            if self._is_active:
+                callback(eventtime)
+        self._reactor.register_async_callback(
+            self._wrap_handler(async_callback))
+    def register_fd(self, fd, callback):
+        handler = self._reactor.register_fd(fd, self._wrap_handler(callback))
+        self._fds.append(handler)
+        return handler
+    def unregister_fd(self, handler):
+        if handler in self._fds:
+            self._fds.remove(handler)
+            self._reactor.unregister_fd(handler)
+    def end(self):
+        if self._is_active:
+            self._end_callback()
+    def release(self):
+        # Remove everything registered by this client
+        self._is_active = False
+        for handler in list(self._timers):
+            self.unregister_timer(handler)
+        for handler in list(self._fds):
+            self.unregister_fd(handler)
+
+# Return the context of the ReactorClient whose callback is running
+def get_client_context():
+    return getattr(greenlet.getcurrent(), 'client_context', None)
+
 # Use the poll based reactor if it is available
 try:
     select.poll
@@ -3,7 +3,7 @@
 # Copyright (C) 2016,2017  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, threading
+import logging, threading, os, struct, zlib
 import serial
 
 import msgproto, chelper, util
@@ -11,12 +11,17 @@ import msgproto, chelper, util
 class error(Exception):
     pass
 
+# Parsed message dictionaries (indexed by raw identify data)
+parsed_identify = {}
+MAX_PARSED_IDENTIFY = 8
+
 class SerialReader:
     BITS_PER_BYTE = 10.
-    def __init__(self, reactor, serialport, baud):
+    def __init__(self, reactor, serialport, baud, identify_cache=None):
         self.reactor = reactor
         self.serialport = serialport
         self.baud = baud
+        self.identify_cache = identify_cache
         # Serial port
         self.ser = None
         self.msgparser = msgproto.MessageParser()
@@ -72,15 +77,25 @@ class SerialReader:
             self.background_thread = threading.Thread(target=self._bg_thread)
             self.background_thread.start()
             # Obtain and load the data dictionary from the firmware
-            sbs = SerialBootStrap(self)
+            sbs = SerialBootStrap(self, self.identify_cache)
             identify_data = sbs.get_identify_data(starttime + 5.)
             if identify_data is None:
                 logging.warn("Timeout on serial connect")
                 self.disconnect()
                 continue
             break
-        msgparser = msgproto.MessageParser()
-        msgparser.process_identify(identify_data)
+        logging.info("Obtained identify data in %.3fs (%d bytes%s)",
+                     self.reactor.monotonic() - starttime, len(identify_data),
+                     [", downloaded", ", from cache"][sbs.is_cached])
+        if sbs.identify_info is not None and not sbs.is_cached:
+            self.identify_cache.save(sbs.identify_info, identify_data)
+        msgparser = parsed_identify.get(identify_data)
+        if msgparser is None:
+            msgparser = msgproto.MessageParser()
+            msgparser.process_identify(identify_data)
+            if len(parsed_identify) >= MAX_PARSED_IDENTIFY:
+                parsed_identify.clear()
+            parsed_identify[identify_data] = msgparser
         self.msgparser = msgparser
         self.register_callback(self.handle_unknown, '#unknown')
         # Setup baud adjust
@@ -127,6 +142,14 @@ class SerialReader:
     def raw_send(self, cmd, minclock, reqclock, cmd_queue):
         self.ffi_lib.serialqueue_send(
             self.serialqueue, cmd_queue, cmd, len(cmd), minclock, reqclock)
+    def raw_send_multiple(self, cmds, minclock, reqclock, cmd_queue):
+        if not cmds:
+            return
+        data = [b for cmd in cmds for b in cmd]
+        lens = [len(cmd) for cmd in cmds]
+        self.ffi_lib.serialqueue_send_multiple(
+            self.serialqueue, cmd_queue, data, lens, len(cmds),
+            minclock, reqclock)
     def send(self, msg, minclock=0, reqclock=0):
         cmd = self.msgparser.create_command(msg)
         self.raw_send(cmd, minclock, reqclock, self.default_cmd_queue)
@@ -186,6 +209,12 @@ class SerialCommand:
         cmd = self.cmd.encode(data)
         src = SerialRetryCommand(self.serial, cmd, response, response_oid)
         return src.get_response()
+    def send_batch_with_response(self, data_list, response=None,
+                                 response_oid=None):
+        cmds = [self.cmd.encode(data) for data in data_list]
+        src = SerialRetryBatch(self.serial, cmds, self.cmd_queue,
+                               response, response_oid)
+        return src.get_responses()
 
 # Class to retry sending of a query command until a given response is received
 class SerialRetryCommand:
@@ -223,15 +252,79 @@ class SerialRetryCommand:
         self.unregister()
         return self.response
 
+# Class to send a series of query commands together (without waiting
+# for each response) and collect all the responses.  The whole series
+# is resent if not all responses are received.
+class SerialRetryBatch:
+    TIMEOUT_TIME = 5.0
+    RETRY_TIME = 0.500
+    def __init__(self, serial, cmds, cmd_queue, name, oid=None):
+        self.serial = serial
+        self.cmds = cmds
+        self.cmd_queue = cmd_queue
+        self.name = name
+        self.oid = oid
+        self.responses = []
+        self.start_time = self.min_query_time = self.serial.reactor.monotonic()
+        self.serial.register_callback(self.handle_callback, self.name, self.oid)
+        self.send_timer = self.serial.reactor.register_timer(
+            self.send_event, self.serial.reactor.NOW)
+    def unregister(self):
+        self.serial.unregister_callback(self.name, self.oid)
+        self.serial.reactor.unregister_timer(self.send_timer)
+    def send_event(self, eventtime):
+        if len(self.responses) >= len(self.cmds):
+            return self.serial.reactor.NEVER
+        self.min_query_time = eventtime
+        self.responses = []
+        for cmd in self.cmds:
+            self.serial.raw_send(cmd, 0, 0, self.cmd_queue)
+        return eventtime + self.RETRY_TIME
+    def handle_callback(self, params):
+        if params['#sent_time'] >= self.min_query_time:
+            self.responses.append(params)
+    def get_responses(self):
+        eventtime = self.serial.reactor.monotonic()
+        while len(self.responses) < len(self.cmds):
+            eventtime = self.serial.reactor.pause(eventtime + 0.005)
+            if eventtime > self.start_time + self.TIMEOUT_TIME:
+                self.unregister()
+                raise error("Timeout on wait for '%s' response" % (self.name,))
+        self.unregister()
+        return self.responses[:len(self.cmds)]
+
+# Identify offset that reports the size and crc32 of the identify data
+IDENTIFY_INFO_OFFSET = 0xffffffff
+
 # Code to start communication and download message type dictionary
 class SerialBootStrap:
     RETRY_TIME = 0.500
-    def __init__(self, serial):
+    FIRST_RETRY_TIME = 0.100
+    CHUNK_SIZE = 40
+    # Maximum identify requests in flight (small enough that the
+    # requests fit in the receive buffer of any mcu)
+    MAX_WINDOW = 8
+    def __init__(self, serial, identify_cache=None):
         self.serial = serial
         self.identify_data = ""
         self.identify_cmd = self.serial.lookup_command(
             "identify offset=%u count=%c")
-        self.is_done = False
+        self.is_done = self.is_cached = False
+        self.lock = threading.Lock()
+        # Windowed download state
+        self.chunks = {}
+        self.outstanding = {}
+        self.send_seq = 0
+        self.next_offset = 0
+        self.data_end = None
+        self.window = 1
+        self.max_window = self.MAX_WINDOW
+        self.window_acks = 0
+        # With a cache, first query the size and crc32 of the identify
+        # data (older firmware responds with no data)
+        self.identify_cache = identify_cache
+        self.identify_info = None
+        self.info_pending = identify_cache is not None
         self.serial.register_callback(self.handle_identify, 'identify_response')
         self.serial.register_callback(self.handle_unknown, '#unknown')
         self.send_timer = self.serial.reactor.register_timer(
@@ -239,30 +332,166 @@ class SerialBootStrap:
     def get_identify_data(self, timeout):
         eventtime = self.serial.reactor.monotonic()
         while not self.is_done and eventtime <= timeout:
-            eventtime = self.serial.reactor.pause(eventtime + 0.05)
+            eventtime = self.serial.reactor.pause(eventtime + 0.005)
         self.serial.unregister_callback('identify_response')
         self.serial.reactor.unregister_timer(self.send_timer)
         if not self.is_done:
             return None
+        if not self.is_cached:
+            logging.info("Downloaded identify data (final window %d/%d)",
+                         self.window, self.max_window)
         return self.identify_data
-    def handle_identify(self, params):
-        if self.is_done or params['offset'] != len(self.identify_data):
+    def _send_identify(self, offset):
+        self.send_seq += 1
+        self.outstanding[offset] = self.send_seq
+        self.identify_cmd.send([offset, self.CHUNK_SIZE])
+    def _fill_window(self):
+        while len(self.outstanding) < self.window:
+            if self.data_end is not None and self.next_offset >= self.data_end:
+                break
+            self._send_identify(self.next_offset)
+            self.next_offset += self.CHUNK_SIZE
+    def _handle_info(self, params):
+        if params['offset'] != IDENTIFY_INFO_OFFSET:
             return
+        self.info_pending = False
         msgdata = params['data']
-        if not msgdata:
+        if len(msgdata) == 8:
+            self.identify_info = struct.unpack('<II', msgdata)
+            data = self.identify_cache.load(self.identify_info)
+            if data is not None:
+                self.identify_data = data
+                self.is_done = self.is_cached = True
+                return
+        self._fill_window()
+    def _handle_chunk(self, params):
+        offset = params['offset']
+        if offset < len(self.identify_data) or offset in self.chunks:
+            # Duplicate response
+            return
+        msgdata = params['data']
+        seq = self.outstanding.pop(offset, 0)
+        self.chunks[offset] = msgdata
+        if len(msgdata) < self.CHUNK_SIZE:
+            end = offset + len(msgdata)
+            if self.data_end is None or end < self.data_end:
+                self.data_end = end
+        # Responses arrive in request order, so any earlier request
+        # still outstanding had its response dropped by the mcu
+        lost = [o for o, s in self.outstanding.items() if s < seq]
+        if lost:
+            self.max_window = max(1, self.window - 1)
+            self.window = max(1, self.window // 2)
+            self.window_acks = 0
+            for o in lost:
+                self._send_identify(o)
+        else:
+            self.window_acks += 1
+            if self.window_acks >= self.window:
+                self.window = min(self.window + 1, self.max_window)
+                self.window_acks = 0
+        # Assemble received chunks
+        while 1:
+            data = self.chunks.pop(len(self.identify_data), None)
+            if data is None:
+                break
+            self.identify_data += data
+        if (self.data_end is not None
+            and len(self.identify_data) >= self.data_end):
             self.is_done = True
             return
-        self.identify_data += msgdata
-        self.identify_cmd.send([len(self.identify_data), 40])
+        self._fill_window()
+    def handle_identify(self, params):
+        with self.lock:
+            if self.is_done:
+                return
+            if self.info_pending:
+                self._handle_info(params)
+            else:
+                self._handle_chunk(params)
     def send_event(self, eventtime):
-        if self.is_done:
-            return self.serial.reactor.NEVER
-        self.identify_cmd.send([len(self.identify_data), 40])
+        with self.lock:
+            if self.is_done:
+                return self.serial.reactor.NEVER
+            if self.info_pending:
+                self.identify_cmd.send([IDENTIFY_INFO_OFFSET, self.CHUNK_SIZE])
+            elif not self.outstanding:
+                self._fill_window()
+            else:
+                # Resend requests that have not been answered
+                for offset in sorted(self.outstanding):
+                    self._send_identify(offset)
+            if not self.identify_data and not self.chunks:
+                # The first request after opening the port is often lost
+                return eventtime + self.FIRST_RETRY_TIME
         return eventtime + self.RETRY_TIME
     def handle_unknown(self, params):
         logging.debug("Unknown message %d (len %d) while identifying",
                       params['#msgid'], len(params['#msg']))
 
+# Storage of identify data on disk (indexed by the size and crc32
+# that the mcu reports for its identify data)
+class IdentifyCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+    def _check_dir(self):
+        # Only use a private directory owned by this user
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir, 0700)
+            st = os.stat(self.cache_dir)
+        except OSError as e:
+            logging.warn("Unable to use identify cache %s: %s",
+                         self.cache_dir, e)
+            return False
+        if st.st_uid != os.getuid() or st.st_mode & 0077:
+            logging.warn("Not using identify cache %s - it must be owned"
+                         " by this user and not accessible by others",
+                         self.cache_dir)
+            return False
+        return True
+    def _get_filename(self, identify_info):
+        return os.path.join(self.cache_dir, "%d-%08x.identify" % identify_info)
+    def load(self, identify_info):
+        if not self._check_dir():
+            return None
+        filename = self._get_filename(identify_info)
+        try:
+            f = open(filename, 'rb')
+            st = os.fstat(f.fileno())
+            data = f.read()
+            f.close()
+        except (IOError, OSError):
+            return None
+        if st.st_uid != os.getuid() or st.st_mode & 0022:
+            logging.warn("Ignoring identify cache file %s (not owned by"
+                         " this user or writable by others)", filename)
+            return None
+        size, crc = identify_info
+        if len(data) != size or zlib.crc32(data) & 0xffffffff != crc:
+            logging.info("Ignoring invalid identify cache file %s", filename)
+            return None
+        return data
+    def save(self, identify_info, identify_data):
+        size, crc = identify_info
+        if (len(identify_data) != size
+            or zlib.crc32(identify_data) & 0xffffffff != crc):
+            logging.warn("Identify data does not match reported size/crc")
+            return
+        if not self._check_dir():
+            return
+        filename = self._get_filename(identify_info)
+        try:
+            fd = os.open(filename + ".tmp",
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+            f = os.fdopen(fd, 'wb')
+            f.write(identify_data)
+            f.close()
+            os.rename(filename + ".tmp", filename)
+        except (IOError, OSError) as e:
+            logging.warn("Unable to write identify cache %s: %s",
+                         filename, e)
+
 # Attempt to place an AVR stk500v2 style programmer into normal mode
 def stk500v2_leave(ser, reactor):
     logging.debug("Starting stk500v2 leave programmer sequence")
@@ -40,6 +40,7 @@ class Move:
         self.delta_v2 = 2.0 * move_d * self.accel
         self.max_smoothed_v2 = 0.
         self.smooth_delta_v2 = 2.0 * move_d * toolhead.max_accel_to_decel
+        self.timing_callbacks = []
     def limit_speed(self, speed, accel):
         speed2 = speed**2
         if speed2 < self.max_cruise_v2:
@@ -106,8 +107,10 @@ class Move:
             self.toolhead.kin.move(next_move_time, self)
         if self.axes_d[3]:
             self.toolhead.extruder.move(next_move_time, self)
-        self.toolhead.update_move_time(
-            self.accel_t + self.cruise_t + self.decel_t)
+        move_t = self.accel_t + self.cruise_t + self.decel_t
+        self.toolhead.update_move_time(move_t)
+        for cb in self.timing_callbacks:
+            cb(next_move_time + move_t)
 
 LOOKAHEAD_FLUSH_TIME = 0.250
 
@@ -119,10 +122,12 @@ class MoveQueue:
         self.queue = []
         self.leftover = 0
         self.junction_flush = LOOKAHEAD_FLUSH_TIME
+        self.junction_stop = False
     def reset(self):
         del self.queue[:]
         self.leftover = 0
         self.junction_flush = LOOKAHEAD_FLUSH_TIME
+        self.junction_stop = False
     def set_flush_time(self, flush_time):
         self.junction_flush = flush_time
     def set_extruder(self, extruder):
@@ -182,11 +187,21 @@ class MoveQueue:
         # Remove processed moves from the queue
         self.leftover = flush_count - move_count
         del queue[:move_count]
+    def get_last(self):
+        if self.queue:
+            return self.queue[-1]
+        return None
+    def set_junction_stop(self):
+        # Require the next queued move to start from a full stop
+        self.junction_stop = True
     def add_move(self, move):
         self.queue.append(move)
+        junction_stop = self.junction_stop
+        self.junction_stop = False
         if len(self.queue) == 1:
             return
-        move.calc_junction(self.queue[-2])
+        if not junction_stop:
+            move.calc_junction(self.queue[-2])
         self.junction_flush -= move.min_move_t
         if self.junction_flush <= 0.:
             # Enough moves have been queued to reach the target flush time.
@@ -363,6 +378,22 @@ class ToolHead:
         self.move_queue.add_move(move)
         if self.print_time > self.need_check_stall:
             self._check_stall()
+    def register_lookahead_callback(self, callback):
+        # Invoke callback(print_time) once all currently queued moves
+        # have been flushed (without forcing a lookahead flush)
+        last_move = self.move_queue.get_last()
+        if last_move is None:
+            callback(self.get_last_move_time())
+            return
+        last_move.timing_callbacks.append(callback)
+    def queue_kinematic_change(self, newpos, callback):
+        # Change the commanded position at the current point in the
+        # lookahead queue; callback(print_time) is invoked when the
+        # preceding moves are flushed so that the kinematics can
+        # update their internal state at the matching time.
+        self.register_lookahead_callback(callback)
+        self.move_queue.set_junction_stop()
+        self.commanded_pos[:] = newpos
     def dwell(self, delay, check_stall=True):
         self.get_last_move_time()
         self.update_move_time(delay)
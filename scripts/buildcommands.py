@@ -5,7 +5,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import sys, os, subprocess, optparse, logging, shlex, socket, time, traceback
-import json, zlib
+import json, zlib, struct
 sys.path.append('./klippy')
 import msgproto
 
@@ -518,6 +518,11 @@ class HandleIdentify:
             if i % 8 == 0:
                 out.append('\n   ')
             out.append(" 0x%02x," % (ord(zdatadict[i]),))
+        # Size and crc32 of the compressed data (so that the host can
+        # identify a cached copy of it)
+        info = struct.pack('<II', len(zdatadict),
+                           zlib.crc32(zdatadict) & 0xffffffff)
+        info_out = ["\n   "] + [" 0x%02x," % (ord(c),) for c in info]
         fmt = """
 const uint8_t command_identify_data[] PROGMEM = {%s
 };
@@ -525,8 +530,12 @@ const uint8_t command_identify_data[] PROGMEM = {%s
 // Identify size = %d (%d uncompressed)
 const uint32_t command_identify_size PROGMEM
     = ARRAY_SIZE(command_identify_data);
+
+const uint8_t command_identify_info[] PROGMEM = {%s
+};
 """
-        return fmt % (''.join(out), len(zdatadict), len(datadict))
+        return fmt % (''.join(out), len(zdatadict), len(datadict),
+                      ''.join(info_out))
 
 Handlers.append(HandleIdentify())
 
@@ -4,11 +4,12 @@
 # Copyright (C) 2016-2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import optparse, datetime
+import optparse, datetime, json, itertools
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot, matplotlib.dates, matplotlib.font_manager
 import matplotlib.ticker
+import logindex
 
 MAXBANDWIDTH=25000.
 MAXBUFFER=2.
@@ -18,49 +19,85 @@ TASK_MAX=0.0025
 APPLY_PREFIX = [
     'mcu_awake', 'mcu_task_avg', 'mcu_task_stddev', 'bytes_write',
     'bytes_read', 'bytes_retransmit', 'freq', 'adj',
+    'rtt', 'stddev', 'drift', 'outliers', 'resets', 'fast_queries',
     'target', 'temp', 'pwm'
 ]
 
-def parse_log(logname, mcu):
-    if mcu is None:
-        mcu = "mcu"
-    mcu_prefix = mcu + ":"
-    apply_prefix = { p: 1 for p in APPLY_PREFIX }
-    f = open(logname, 'rb')
-    out = []
-    for line in f:
-        parts = line.split()
-        if not parts or parts[0] not in ('Stats', 'INFO:root:Stats'):
-            #if parts and parts[0] == 'INFO:root:shutdown:':
-            #    break
+def parse_record(line, mcu, apply_prefix):
+    # Parse a json stats record (as written with klippy's --stats-file)
+    record = json.loads(line)
+    keyparts = {}
+    for group, vals in record.items():
+        if not isinstance(vals, dict):
+            keyparts[group] = vals
             continue
-        prefix = ""
-        keyparts = {}
-        for p in parts[2:]:
-            if '=' not in p:
-                prefix = p
-                if prefix == mcu_prefix:
-                    prefix = ''
-                continue
-            name, val = p.split('=', 1)
+        prefix = group + ':'
+        if group == mcu:
+            prefix = ''
+        for name, val in vals.items():
             if name in apply_prefix:
                 name = prefix + name
             keyparts[name] = val
-        if 'print_time' not in keyparts:
+    return keyparts
+
+def parse_line(line, mcu_prefix, apply_prefix):
+    parts = line.split()
+    if not parts or parts[0] not in ('Stats', 'INFO:root:Stats'):
+        return None
+    prefix = ""
+    keyparts = {}
+    for p in parts[2:]:
+        if '=' not in p:
+            prefix = p
+            if prefix == mcu_prefix:
+                prefix = ''
             continue
-        keyparts['#sampletime'] = float(parts[1][:-1])
-        out.append(keyparts)
+        name, val = p.split('=', 1)
+        if name in apply_prefix:
+            name = prefix + name
+        keyparts[name] = val
+    keyparts['#sampletime'] = float(parts[1][:-1])
+    return keyparts
+
+def read_lines(logname, start_time, end_time):
+    f = open(logname, 'rb')
+    if start_time is None and end_time is None:
+        for line in f:
+            yield line
+    else:
+        # Only read the parts of the log covering the requested window
+        index = logindex.load_index(logname)
+        for start_offset, end_offset in index.get_stats_ranges(
+                start_time, end_time):
+            for line in logindex.read_range(f, start_offset, end_offset):
+                yield line
     f.close()
-    return out
+
+def parse_log(logname, mcu, start_time=None, end_time=None):
+    # Generate the stats samples found in the log
+    if mcu is None:
+        mcu = "mcu"
+    mcu_prefix = mcu + ":"
+    apply_prefix = { p: 1 for p in APPLY_PREFIX }
+    for line in read_lines(logname, start_time, end_time):
+        if line.startswith('{'):
+            keyparts = parse_record(line, mcu, apply_prefix)
+        else:
+            keyparts = parse_line(line, mcu_prefix, apply_prefix)
+        if keyparts is None or 'print_time' not in keyparts:
+            continue
+        st = keyparts['#sampletime']
+        if ((start_time is not None and st < start_time)
+            or (end_time is not None and st > end_time)):
+            continue
+        yield keyparts
 
 def find_print_restarts(data):
     runoff_samples = {}
     last_runoff_start = last_buffer_time = last_sampletime = 0.
     last_print_stall = 0
-    for d in reversed(data):
+    for sampletime, buffer_time, print_stall in reversed(data):
         # Check for buffer runoff
-        sampletime = d['#sampletime']
-        buffer_time = float(d.get('buffer_time', 0.))
         if (last_runoff_start and last_sampletime - sampletime < 5
             and buffer_time > last_buffer_time):
             runoff_samples[last_runoff_start][1].append(sampletime)
@@ -72,7 +109,6 @@ def find_print_restarts(data):
         last_buffer_time = buffer_time
         last_sampletime = sampletime
         # Check for print stall
-        print_stall = int(d['print_stall'])
         if print_stall < last_print_stall:
             if last_runoff_start:
                 runoff_samples[last_runoff_start][0] = True
@@ -82,29 +118,36 @@ def find_print_restarts(data):
     return sample_resets
 
 def plot_mcu(data, maxbw, outname):
+    # Only keep the fields needed for the plot (data may be a generator)
+    samples = []
+    for d in data:
+        samples.append((
+            d['#sampletime'],
+            float(d['bytes_write']) + float(d['bytes_retransmit']),
+            float(d['mcu_task_avg']) + 3*float(d['mcu_task_stddev']),
+            float(d.get('buffer_time', 0.)), int(d['print_stall']),
+            float(d.get('mcu_awake', 0.))))
+    if not samples:
+        return
     # Generate data for plot
-    basetime = lasttime = data[0]['#sampletime']
-    lastbw = float(data[0]['bytes_write']) + float(data[0]['bytes_retransmit'])
-    sample_resets = find_print_restarts(data)
+    basetime = lasttime = samples[0][0]
+    lastbw = samples[0][1]
+    sample_resets = find_print_restarts(
+        [(s[0], s[3], s[4]) for s in samples])
     times = []
     bwdeltas = []
     loads = []
     awake = []
     hostbuffers = []
-    for d in data:
-        st = d['#sampletime']
+    for st, bw, load, hb, print_stall, mcu_awake in samples:
         timedelta = st - lasttime
         if timedelta <= 0.:
             continue
-        bw = float(d['bytes_write']) + float(d['bytes_retransmit'])
         if bw < lastbw:
             lastbw = bw
             continue
-        load = float(d['mcu_task_avg']) + 3*float(d['mcu_task_stddev'])
         if st - basetime < 15.:
             load = 0.
-        pt = float(d['print_time'])
-        hb = float(d['buffer_time'])
         if hb >= MAXBUFFER or st in sample_resets:
             hb = 0.
         else:
@@ -113,7 +156,7 @@ def plot_mcu(data, maxbw, outname):
         times.append(datetime.datetime.utcfromtimestamp(st))
         bwdeltas.append(100. * (bw - lastbw) / (maxbw * timedelta))
         loads.append(100. * load / TASK_MAX)
-        awake.append(100. * float(d.get('mcu_awake', 0.)) / STATS_INTERVAL)
+        awake.append(100. * mcu_awake / STATS_INTERVAL)
         lasttime = st
         lastbw = bw
 
@@ -135,18 +178,18 @@ def plot_mcu(data, maxbw, outname):
     fig.savefig(outname)
 
 def plot_frequency(data, outname, mcu):
-    all_keys = {}
-    for d in data:
-        all_keys.update(d)
     one_mcu = mcu is not None
-    graph_keys = { key: ([], []) for key in all_keys
-                   if (key in ("freq", "adj") or (not one_mcu and (
-                           key.endswith(":freq") or key.endswith(":adj")))) }
+    graph_keys = {}
     for d in data:
         st = datetime.datetime.utcfromtimestamp(d['#sampletime'])
-        for key, (times, values) in graph_keys.items():
-            val = d.get(key)
-            if val not in (None, '0', '1'):
+        for key, val in d.items():
+            if key not in graph_keys:
+                if not (key in ("freq", "adj") or (not one_mcu and (
+                        key.endswith(":freq") or key.endswith(":adj")))):
+                    continue
+                graph_keys[key] = ([], [])
+            if float(val) not in (0., 1.):
+                times, values = graph_keys[key]
                 times.append(st)
                 values.append(float(val))
 
@@ -205,7 +248,7 @@ def plot_temperature(data, outname, heater):
     fig.savefig(outname)
 
 def main():
-    usage = "%prog [options] <logfile> <outname>"
+    usage = "%prog [options] <logfile|statsfile> <outname>"
     opts = optparse.OptionParser(usage)
     opts.add_option("-f", "--frequency", action="store_true",
                     help="graph mcu frequency")
@@ -213,13 +256,19 @@ def main():
                     default=None, help="graph heater temperature")
     opts.add_option("-m", "--mcu", type="string", dest="mcu", default=None,
                     help="limit stats to the given mcu")
+    opts.add_option("-s", "--start", type="float", dest="start", default=None,
+                    help="skip stats before the given sample time")
+    opts.add_option("-e", "--end", type="float", dest="end", default=None,
+                    help="skip stats after the given sample time")
     options, args = opts.parse_args()
     if len(args) != 2:
         opts.error("Incorrect number of arguments")
     logname, outname = args
-    data = parse_log(logname, options.mcu)
-    if not data:
+    data = parse_log(logname, options.mcu, options.start, options.end)
+    first = next(data, None)
+    if first is None:
         return
+    data = itertools.chain([first], data)
     if options.heater is not None:
         plot_temperature(data, outname, options.heater)
         return
@@ -4,7 +4,8 @@
 # Copyright (C) 2017  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import sys, re, collections, ast
+import sys, os, re, collections, ast
+import logindex
 
 def format_comment(line_num, line):
     return "# %6d: %s" % (line_num, line)
@@ -303,41 +304,79 @@ class GatherShutdown:
 # Startup
 ######################################################################
 
-def main():
-    logname = sys.argv[1]
-    last_git = last_start = None
-    configs = {}
-    handler = None
-    recent_lines = collections.deque([], 200)
-    # Parse log file
-    f = open(logname, 'rb')
-    for line_num, line in enumerate(f):
-        line = line.rstrip()
-        line_num += 1
+class LogExtract:
+    def __init__(self, logname):
+        self.logname = logname
+        self.last_git = self.last_start = None
+        self.configs = {}
+        self.handler = None
+        self.recent_lines = collections.deque([], 200)
+    def add_line(self, line_num, line):
+        recent_lines = self.recent_lines
         recent_lines.append((line_num, line))
-        if handler is not None:
-            ret = handler.add_line(line_num, line)
+        if self.handler is not None:
+            ret = self.handler.add_line(line_num, line)
             if ret:
-                continue
+                return
             recent_lines.clear()
-            handler = None
+            self.handler = None
         if line.startswith('Git version'):
-            last_git = format_comment(line_num, line)
+            self.last_git = format_comment(line_num, line)
         elif line.startswith('Start printer at'):
-            last_start = format_comment(line_num, line)
+            self.last_start = format_comment(line_num, line)
         elif line == '===== Config file =====':
-            handler = GatherConfig(configs, line_num, recent_lines, logname)
-            handler.add_comment(last_git)
-            handler.add_comment(last_start)
+            self.handler = GatherConfig(self.configs, line_num, recent_lines,
+                                        self.logname)
+            self.handler.add_comment(self.last_git)
+            self.handler.add_comment(self.last_start)
         elif 'shutdown: ' in line or line.startswith('Dumping '):
-            handler = GatherShutdown(configs, line_num, recent_lines, logname)
-            handler.add_comment(last_git)
-            handler.add_comment(last_start)
-    if handler is not None:
-        handler.finalize()
-    # Write found config files
-    for cfg in configs.values():
-        cfg.write_file()
+            self.handler = GatherShutdown(self.configs, line_num, recent_lines,
+                                          self.logname)
+            self.handler.add_comment(self.last_git)
+            self.handler.add_comment(self.last_start)
+    def finalize(self):
+        if self.handler is not None:
+            self.handler.finalize()
+        # Write found config files
+        for cfg in self.configs.values():
+            cfg.write_file()
+
+def read_lines(f, offset, line_num):
+    f.seek(offset)
+    for line in f:
+        offset += len(line)
+        line_num += 1
+        yield offset, line_num, line.rstrip()
+
+def main():
+    logname = sys.argv[1]
+    extract = LogExtract(logname)
+    # Only parse the regions of the log around config dumps and
+    # shutdowns (found via the log index)
+    index = logindex.load_index(logname)
+    markers = index.get_markers()
+    f = open(logname, 'rb')
+    if os.fstat(f.fileno()).st_size > index.size:
+        # Parse any incomplete line at the end of the log
+        markers.append(('tail', index.size, index.line_count + 1))
+    pos_offset = pos_line = 0
+    for kind, offset, line_num in markers:
+        if line_num <= pos_line:
+            continue
+        start_offset, start_line = offset, line_num
+        if kind in (logindex.M_SHUTDOWN, 'tail'):
+            # Shutdown reports include the lines before the shutdown
+            start_line = max(line_num - 199, pos_line + 1)
+            start_offset = logindex.find_line_start(
+                f, offset, line_num - start_line, pos_offset)
+        extract.recent_lines.clear()
+        for pos_offset, pos_line, line in read_lines(
+                f, start_offset, start_line - 1):
+            extract.add_line(pos_line, line)
+            if pos_line >= line_num and extract.handler is None:
+                break
+    f.close()
+    extract.finalize()
 
 if __name__ == '__main__':
     main()
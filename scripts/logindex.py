@@ -0,0 +1,191 @@
+# Byte offset index of interesting lines in a klippy.log file
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import os, json, hashlib
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index"
+# Record the position of every Nth stats line
+STATS_INTERVAL = 64
+HEAD_SIZE = 4096
+
+# Marker types
+M_CONFIG = 'config'
+M_SHUTDOWN = 'shutdown'
+M_GIT = 'git'
+M_START = 'start'
+
+def get_marker(line):
+    if line.startswith('Git version'):
+        return M_GIT
+    if line.startswith('Start printer at'):
+        return M_START
+    if line == '===== Config file =====':
+        return M_CONFIG
+    if 'shutdown: ' in line or line.startswith('Dumping '):
+        return M_SHUTDOWN
+    return None
+
+def get_stats_time(line):
+    # Return the sample time of a stats line (or None)
+    if line.startswith('Stats '):
+        pos = 6
+    elif line.startswith('INFO:root:Stats '):
+        pos = 16
+    elif line.startswith('{"#sampletime": '):
+        # Json record from klippy's --stats-file option
+        try:
+            return float(line[16:line.index(',', 16)])
+        except ValueError:
+            return None
+    else:
+        return None
+    try:
+        return float(line[pos:line.index(':', pos)])
+    except ValueError:
+        return None
+
+def read_head(f):
+    f.seek(0)
+    return hashlib.md5(f.read(HEAD_SIZE)).hexdigest()
+
+class LogIndex:
+    def __init__(self, logname):
+        self.logname = logname
+        self.size = self.line_count = self.stats_count = 0
+        self.head = None
+        self.stats = []
+        self.markers = []
+    def _load(self):
+        try:
+            f = open(self.logname + INDEX_SUFFIX, 'rb')
+            data = json.load(f)
+            f.close()
+        except (IOError, ValueError):
+            return
+        if data.get('version') != INDEX_VERSION:
+            return
+        self.size = data['size']
+        self.line_count = data['lines']
+        self.stats_count = data['stats_count']
+        self.head = data['head']
+        self.stats = data['stats']
+        self.markers = data['markers']
+    def _save(self):
+        data = {'version': INDEX_VERSION, 'size': self.size,
+                'lines': self.line_count, 'stats_count': self.stats_count,
+                'head': self.head, 'stats': self.stats,
+                'markers': self.markers}
+        try:
+            f = open(self.logname + INDEX_SUFFIX, 'wb')
+            json.dump(data, f)
+            f.close()
+        except IOError:
+            # The index is only a cache
+            pass
+    def _scan(self, f):
+        # Add the lines after self.size to the index
+        f.seek(self.size)
+        offset = self.size
+        line_num = self.line_count
+        stats_count = self.stats_count
+        stats, markers = self.stats, self.markers
+        for line in f:
+            if not line.endswith('\n'):
+                # Incomplete line (log is still being written)
+                break
+            line_offset = offset
+            offset += len(line)
+            line_num += 1
+            line = line.rstrip()
+            st = get_stats_time(line)
+            if st is not None:
+                if not stats_count % STATS_INTERVAL:
+                    stats.append((st, line_offset, line_num))
+                stats_count += 1
+            else:
+                marker = get_marker(line)
+                if marker is not None:
+                    markers.append((marker, line_offset, line_num))
+        self.size = offset
+        self.line_count = line_num
+        self.stats_count = stats_count
+    def update(self):
+        # Load the cached index and extend it with new lines of the log
+        f = open(self.logname, 'rb')
+        self._load()
+        head = read_head(f)
+        file_size = os.fstat(f.fileno()).st_size
+        if (head != self.head or file_size < self.size
+            or (self.size < HEAD_SIZE and file_size != self.size)):
+            # Log was replaced - build a new index
+            self.__init__(self.logname)
+        if file_size != self.size:
+            indexed_size = self.size
+            self._scan(f)
+            if self.size != indexed_size:
+                self.head = read_head(f)
+                self._save()
+        f.close()
+        return self
+    def get_markers(self, kinds=None):
+        return [m for m in self.markers if kinds is None or m[0] in kinds]
+    def get_stats_ranges(self, start_time=None, end_time=None):
+        # Return (start_offset, end_offset) ranges of the log that may
+        # contain stats lines with a sample time in the given window
+        # (sample times may restart in the log after a host reboot)
+        if start_time is None:
+            start_time = float('-inf')
+        if end_time is None:
+            end_time = float('inf')
+        stats = self.stats
+        ranges = []
+        for i, (st, offset, line_num) in enumerate(stats):
+            if i + 1 < len(stats):
+                next_st, next_offset = stats[i+1][:2]
+            else:
+                next_st, next_offset = float('inf'), None
+            if next_st < st:
+                # Sample time restarted within this range
+                st, next_st = float('-inf'), float('inf')
+            if st > end_time or next_st < start_time:
+                continue
+            if ranges and ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], next_offset)
+            else:
+                ranges.append((offset, next_offset))
+        return ranges
+
+def read_range(f, start_offset, end_offset):
+    # Iterate over the lines in a range of the log
+    f.seek(start_offset)
+    offset = start_offset
+    for line in f:
+        if end_offset is not None and offset >= end_offset:
+            break
+        offset += len(line)
+        yield line
+
+def find_line_start(f, offset, count, min_offset=0):
+    # Return the offset of the line that is count lines before the
+    # line starting at offset (without going past min_offset)
+    if not count:
+        return offset
+    chunk = 8192
+    while 1:
+        low = max(min_offset, offset - chunk)
+        f.seek(low)
+        data = f.read(offset - low)
+        pos = len(data) - 1
+        for i in range(count):
+            pos = data.rfind('\n', 0, pos)
+            if pos < 0:
+                break
+        else:
+            return low + pos + 1
+        if low == min_offset:
+            return low
+        chunk *= 4
+
+def load_index(logname):
+    return LogIndex(logname).update()
@@ -308,18 +308,27 @@ command_clear_shutdown(uint32_t *args)
 }
 DECL_COMMAND_FLAGS(command_clear_shutdown, HF_IN_SHUTDOWN, "clear_shutdown");
 
+// Requesting this offset reports the identify data size and crc32
+#define IDENTIFY_INFO_OFFSET 0xffffffff
+
 void
 command_identify(uint32_t *args)
 {
     uint32_t offset = args[0];
     uint8_t count = args[1];
     uint32_t isize = READP(command_identify_size);
-    if (offset >= isize)
+    const uint8_t *data = command_identify_data;
+    if (offset == IDENTIFY_INFO_OFFSET) {
+        data = command_identify_info;
+        count = sizeof(command_identify_info);
+    } else if (offset >= isize) {
         count = 0;
-    else if (offset + count > isize)
-        count = isize - offset;
-    sendf("identify_response offset=%u data=%.*s"
-          , offset, count, &command_identify_data[offset]);
+    } else {
+        data += offset;
+        if (count > isize - offset)
+            count = isize - offset;
+    }
+    sendf("identify_response offset=%u data=%.*s", offset, count, data);
 }
 DECL_COMMAND_FLAGS(command_identify, HF_IN_SHUTDOWN,
                    "identify offset=%u count=%c");